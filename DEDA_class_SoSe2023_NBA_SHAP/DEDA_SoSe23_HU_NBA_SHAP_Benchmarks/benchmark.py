@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# The pipeline modules live in the data sourcing and shapley calculation folders
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCING = os.path.join(HERE, '..', 'DEDA_SoSe23_HU_NBA_SHAP_Data_Sourcing_NBA_Games')
+SHAPLEY = os.path.join(HERE, '..', 'DEDA_SoSe23_HU_NBA_SHAP_Calculate_Shapley_Values_from_NBA_Games')
+sys.path[:0] = [SOURCING, SHAPLEY]
+
+import abs_values
+import calculate_shapley
+import data_sourcing
+import deans_factors
+import lineups
+import scorers
+import season_store
+import shapley_batch
+import synthetic_nba
+warnings.filterwarnings('ignore')
+
+
+def measure(stage, func, items, unit, repeat=1, memory=True):
+    # best and mean wall time over repeat runs, peak traced memory of one extra run (tracing slows the code down)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter()-start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]/2**20
+        tracemalloc.stop()
+
+    best = min(times)
+    stats = {'stage': stage, 'seconds': best, 'mean_seconds': sum(times)/len(times), 'repeat': repeat,
+             'items': int(items), 'unit': unit, 'throughput': items/best if best > 0 else None, 'peak_memory_mb': peak}
+    print(f'{stage:<22} {best:9.4f} s  {stats["throughput"] or 0:14.1f} {unit}/s', file=sys.stderr)
+
+    return result, stats
+
+
+def run(args, workdir):
+    database = os.path.join(workdir, 'nba.sqlite')
+    store = os.path.join(workdir, 'season_absolute_values')
+
+    roster = synthetic_nba.build_database(database, args.games, args.roster_size, args.events_per_game, args.team,
+                                          args.season_id, args.other_games, synthetic_nba.event_rates_arg(args.event_rates),
+                                          args.seed)
+    # source_data reads the roster file from the working directory
+    synthetic_nba.write_rosters(os.path.join(workdir, 'lakers_rosters.csv'), roster, args.players_season)
+    os.chdir(workdir)
+
+    conn = sqlite3.connect(database)
+    season = data_sourcing.load_season_pbp(conn, args.team, args.season_id)
+    conn.close()
+    events = len(season.index)
+    games = [data_game for game, data_game in season.groupby('game_id', sort=False)]
+
+    stages = []
+
+    # whole sourcing step, without the game cache so every run parses all games
+    _, stats = measure('source_data', lambda: data_sourcing.source_data(args.team, args.season_id, args.players_season, database,
+                                                                        workers=args.workers, cache=None, store=store),
+                       events, 'events', args.repeat, args.memory)
+    stages.append(stats)
+
+    game_lineups, stats = measure('play_by_play_lineup', lambda: [lineups.play_by_play_lineup(data_game) for data_game in games],
+                                  events, 'events', args.repeat, args.memory)
+    stages.append(stats)
+
+    games = [data_game.assign(home_lineup=game_lineup['lineup_home'].to_numpy(), away_lineup=game_lineup['lineup_away'].to_numpy())
+             for data_game, game_lineup in zip(games, game_lineups)]
+    _, stats = measure('player_data_calc', lambda: [abs_values.player_data_calc(data_game, roster, args.team) for data_game in games],
+                       events, 'events', args.repeat, args.memory)
+    stages.append(stats)
+
+    # lineup features of the sourced season (all lineups of the active roster)
+    season_data = season_store.read_season(store, args.team, args.players_season)
+    thresh = args.thresh if args.thresh is not None else args.games//2
+    active = deans_factors.get_active_roster(season_data, roster, thresh)
+    combinations = deans_factors.get_combinations(active, unique=True)
+
+    factors, stats = measure('deans_factors_season', lambda: deans_factors.deans_factors_season(season_data, combinations),
+                             len(combinations), 'lineups', args.repeat, args.memory)
+    stages.append(stats)
+
+    with open(os.path.join(SHAPLEY, shapley_batch.MODELS[args.model]), 'rb') as f:
+        model = pickle.load(f)
+    features = pd.DataFrame(factors).fillna(0)
+
+    probas, stats = measure('calculate_probas', lambda: calculate_shapley.calculate_probas(features, model),
+                            len(combinations), 'lineups', args.repeat, args.memory)
+    stages.append(stats)
+
+    # same lineups with the compiled NumPy scorer, it has to agree with predict_proba
+    scorer = scorers.compile_model(model)
+    compiled_probas, stats = measure('compiled_probas', lambda: calculate_shapley.calculate_probas(features, scorer),
+                                     len(combinations), 'lineups', args.repeat, args.memory)
+    stats['max_abs_difference'] = float(np.max(np.abs(compiled_probas-probas), initial=0))
+    stages.append(stats)
+    if stats['max_abs_difference'] > args.atol:
+        raise ValueError(f'compiled {args.model} differs from predict_proba by {stats["max_abs_difference"]:.3g}')
+
+    features = features.assign(probas=probas)
+    _, stats = measure('calculate_shapley', lambda: calculate_shapley.calculate_shapley(features, active),
+                       len(combinations), 'lineups', args.repeat, args.memory)
+    stages.append(stats)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    config.update({'events': events, 'active_players': len(active), 'lineups': len(combinations)})
+
+    return {'config': config, 'stages': stages,
+            'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                            'machine': platform.machine()},
+            # ru_maxrss is in kilobytes on Linux
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024}
+
+
+def regressions(result, baseline, tolerance):
+    # stages slower than the baseline run by more than tolerance (relative)
+    before = {stage['stage']: stage['seconds'] for stage in baseline['stages']}
+
+    return [(stage['stage'], before[stage['stage']], stage['seconds']) for stage in result['stages']
+            if stage['stage'] in before and stage['seconds'] > before[stage['stage']]*(1+tolerance)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=82)
+    parser.add_argument('--roster-size', type=int, default=15)
+    parser.add_argument('--events-per-game', type=int, default=400)
+    parser.add_argument('--event-rates', nargs='+', default=None, help='relative rates per event type, e.g. 1:80 2:90 8:45')
+    parser.add_argument('--other-games', type=int, default=0)
+    parser.add_argument('--team', type=str, default='LAL')
+    parser.add_argument('--season-id', type=str, default='22018')
+    parser.add_argument('--players-season', type=str, default='18_19')
+    parser.add_argument('--thresh', type=int, default=None, help='active roster threshold (default: half of the games)')
+    parser.add_argument('--model', type=str, default='log_reg', choices=list(shapley_batch.MODELS))
+    parser.add_argument('--atol', type=float, default=1e-6, help='allowed difference of the compiled scorer to predict_proba')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the traced peak memory runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='json file (default: stdout)')
+    parser.add_argument('--baseline', type=str, default=None, help='json of an earlier run, exit 1 on slower stages')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run(args, workdir)
+        os.chdir(HERE)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+    if baseline:
+        with open(baseline) as f:
+            slower = regressions(result, json.load(f), args.tolerance)
+        for stage, before, after in slower:
+            print(f'{stage} slower than baseline: {before:.4f} s --> {after:.4f} s', file=sys.stderr)
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,164 @@
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# Synthetic play by play data in the schema of nba.sqlite (play_by_play, game and game_info tables, only the
+# columns data_sourcing reads), so the pipeline can be run and benchmarked without the Kaggle database
+
+# Relative event rates (eventmsgtype: 1 made shot, 2 missed shot, 3 free throw, 4 rebound, 5 turnover, 8 substitution)
+EVENT_RATES = {1: 80, 2: 90, 3: 45, 4: 90, 5: 28, 8: 45}
+
+
+def player_names(prefix, size):
+    return [f'{prefix} Player{i:02d}' for i in range(size)]
+
+
+def synthetic_game(rng, home, away, events_per_game, event_rates=None):
+    # Simulates one game as a list of (eventmsgtype, player1, player2, home_desc, neutral_desc, away_desc)
+    event_rates = event_rates or EVENT_RATES
+    on_court = {side: list(rng.choice(len(players), 5, replace=False)) for side, players in (('home', home), ('away', away))}
+    rosters = {'home': home, 'away': away}
+    rebounds = {}
+
+    types = np.array(list(event_rates))
+    weights = np.array(list(event_rates.values()), dtype=float)
+    weights = weights/weights.sum()
+
+    events = [(12, None, None, None, 'Start of 1st Period', None)]
+
+    for event_type in rng.choice(types, size=events_per_game, p=weights):
+        side = 'home' if rng.random() < 0.5 else 'away'
+        players = rosters[side]
+        player = players[on_court[side][rng.integers(5)]]
+        three = rng.random() < 0.35
+        player2 = None
+
+        if event_type == 1:
+            desc = f"{player} 25' 3PT Jump Shot (3 PTS)" if three else f"{player} 2' Layup (2 PTS)"
+        elif event_type == 2:
+            desc = f"MISS {player} 26' 3PT Jump Shot" if three else f"MISS {player} 10' Jump Shot"
+        elif event_type == 3:
+            desc = f"MISS {player} Free Throw 1 of 2" if rng.random() < 0.25 else f"{player} Free Throw 1 of 2 (1 PTS)"
+        elif event_type == 4:
+            if rng.random() < 0.1:
+                # team rebound: no player attached
+                player = None
+                desc = 'Team Rebound'
+            else:
+                off, deff = rebounds.get(player, (0, 0))
+                off, deff = (off+1, deff) if rng.random() < 0.25 else (off, deff+1)
+                rebounds[player] = (off, deff)
+                desc = f"{player} REBOUND (Off:{off} Def:{deff})"
+        elif event_type == 5:
+            desc = f"{player} Bad Pass Turnover (P1.T1)"
+        elif event_type == 8:
+            bench = [i for i in range(len(players)) if i not in on_court[side]]
+            if not bench:
+                continue
+            incoming = bench[rng.integers(len(bench))]
+            position = on_court[side].index(players.index(player))
+            on_court[side][position] = incoming
+            player2 = players[incoming]
+            desc = f"SUB: {player2} FOR {player}"
+        else:
+            desc = f"{player} Foul (P1.T1)"
+
+        events.append((int(event_type), player, player2, desc if side == 'home' else None, None, desc if side == 'away' else None))
+
+    return events
+
+
+def build_database(path, games=82, roster_size=15, events_per_game=400, team='LAL', season_id='22018', other_games=0,
+                   event_rates=None, seed=0):
+    # games of team (plus other_games between other teams of the season), returns the roster of team
+    rng = np.random.default_rng(seed)
+    home_roster = player_names(team, roster_size)
+
+    pbp_rows = []
+    game_rows = []
+    info_rows = []
+
+    for g in range(games+other_games):
+        game_id = f'002{season_id[-2:]}{g+1:05d}'
+        opponent = f'OP{g % 29:02d}'
+        own = home_roster
+        other = player_names(opponent, roster_size)
+        date = (pd.Timestamp(f'{season_id[1:]}-10-16') + pd.Timedelta(days=g)).strftime('%Y-%m-%d 00:00:00')
+
+        own_home = g % 2 == 0
+        home, away = (own, other) if own_home else (other, own)
+        home_abbr, away_abbr = (team, opponent) if own_home else (opponent, team)
+
+        # games of other teams in the same season (for filtering)
+        if g >= games:
+            home, away = other, player_names('OPX', roster_size)
+            home_abbr, away_abbr = opponent, 'OPX'
+
+        for eventnum, event in enumerate(synthetic_game(rng, home, away, events_per_game, event_rates)):
+            event_type, player1, player2, home_desc, neutral_desc, away_desc = event
+            pbp_rows.append((game_id, eventnum, event_type, player1, player2, None, home_desc, neutral_desc, away_desc))
+
+        game_rows.append((game_id, season_id, home_abbr, away_abbr, 'W' if rng.random() < 0.5 else 'L', date))
+        info_rows.append((game_id, date))
+
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.executescript('''
+        DROP TABLE IF EXISTS play_by_play;
+        DROP TABLE IF EXISTS game;
+        DROP TABLE IF EXISTS game_info;
+        CREATE TABLE play_by_play (game_id TEXT, eventnum INTEGER, eventmsgtype INTEGER, player1_name TEXT,
+                                   player2_name TEXT, player3_name TEXT, homedescription TEXT,
+                                   neutraldescription TEXT, visitordescription TEXT);
+        CREATE TABLE game (game_id TEXT, season_id TEXT, team_abbreviation_home TEXT,
+                           team_abbreviation_away TEXT, wl_home TEXT, game_date TEXT);
+        CREATE TABLE game_info (game_id TEXT, game_date TEXT);
+    ''')
+    c.executemany('INSERT INTO play_by_play VALUES (?,?,?,?,?,?,?,?,?)', pbp_rows)
+    c.executemany('INSERT INTO game VALUES (?,?,?,?,?,?)', game_rows)
+    c.executemany('INSERT INTO game_info VALUES (?,?)', info_rows)
+    conn.commit()
+    conn.close()
+
+    return home_roster
+
+
+def write_rosters(path, roster, players_season):
+    # roster file in the layout of lakers_rosters.csv (only the columns data_sourcing uses)
+    pd.DataFrame({'Player': roster, 'Season': players_season}).to_csv(path, sep=';', index=False)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, default='nba_synthetic.sqlite')
+    parser.add_argument('--games', type=int, default=82)
+    parser.add_argument('--roster-size', type=int, default=15)
+    parser.add_argument('--events-per-game', type=int, default=400)
+    parser.add_argument('--event-rates', nargs='+', default=None, help='relative rates per event type, e.g. 1:80 2:90 8:45')
+    parser.add_argument('--other-games', type=int, default=0)
+    parser.add_argument('--team', type=str, default='LAL')
+    parser.add_argument('--season-id', type=str, default='22018')
+    parser.add_argument('--players-season', type=str, default='18_19')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    return args
+
+
+def event_rates_arg(values):
+    if not values:
+        return None
+    return {int(event_type): float(rate) for event_type, rate in (value.split(':') for value in values)}
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    roster = build_database(args.output, args.games, args.roster_size, args.events_per_game, args.team, args.season_id,
+                            args.other_games, event_rates_arg(args.event_rates), args.seed)
+    write_rosters(os.path.join(os.path.dirname(os.path.abspath(args.output)), 'lakers_rosters.csv'), roster, args.players_season)
+    print(f'{args.games} games of {args.team} written to {args.output}')
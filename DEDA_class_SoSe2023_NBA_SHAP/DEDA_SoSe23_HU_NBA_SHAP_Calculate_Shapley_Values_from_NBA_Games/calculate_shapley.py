@@ -1,41 +1,108 @@
 import pandas as pd 
+import numpy as np
 import itertools
-import deans_factors
 import warnings
 import pickle
+import hashlib
+import os
+import contextlib
+import collections
+import deans_factors
+from statistics import NormalDist
 warnings.filterwarnings('ignore')
 
-def calculate_probas(deans_factors,model):  
-    probas = []
-    for i, row in deans_factors.iterrows():
-        probas.append(model.predict_proba([row[5:]])[0][1])
+# Column name matching (Necessary for models fitted on named features, e.g. xgboost)
+renaming = {'off_fg_perc': 'off_eff_fg_perc', 'def_fg_perc': 'def_eff_fg_perc','off_to_perc':'off_tov_perc','def_to_perc':'def_tov_perc','off_rb_perc':'off_reb_perc','def_rb_perc':'def_reb_perc','off_ft_factor':'off_free_throw_factor','def_ft_factor':'def_free_throw_factor'}
+
+lineup_columns = ['player1','player2','player3','player4','player5']
+
+# Disabled default of the profiler arguments: stage timings and counters are recorded by a profiler passed in
+# (e.g. profiling.Profiler of the data sourcing folder), its hooks do nothing here
+class NullProfiler:
+    enabled = False
+    
+    def stage(self,name):
+        return contextlib.nullcontext()
+    
+    def count(self,name,**counts):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+def feature_matrix(deans_factors,model):
+    columns = [column for column in deans_factors.columns if column not in lineup_columns+['probas']]
+    names = [renaming.get(column,column) for column in columns]
+    
+    # Align with the column names (and order) the model was fitted on
+    feature_names = getattr(model,'feature_names_in_',None)
+    if feature_names is not None:
+        columns = [columns[names.index(name)] for name in feature_names]
+        names = list(feature_names)
+    
+    # one copy (the column selection), the factors are float already
+    features = deans_factors[columns]
+    features.columns = names
+    
+    return features.astype(float,copy=False)
+
+def calculate_probas(deans_factors,model,chunk_size=100000):
+    probas = np.empty(len(deans_factors.index))
+    
+    # Score the lineups in batches instead of one predict_proba call per row. The features are built per batch,
+    # so of memory mapped factors (load_lineup_features) only one batch at a time is read and copied
+    for start in range(0,len(deans_factors.index),chunk_size):
+        features = feature_matrix(deans_factors.iloc[start:start+chunk_size],model)
+        probas[start:start+chunk_size] = model.predict_proba(features)[:,1]
+        
     return probas
 
+def lineup_incidence(deans_factors,players):
+    # lineups x 5 matrix of integer player codes (position in players), -1 for anyone else
+    codes = [pd.Categorical(deans_factors[column],categories=players).codes for column in lineup_columns]
+    
+    return np.column_stack(codes).astype(np.intp)
+
 def calculate_shapley(deans_factors,active_players):
-    shapley_values={}
-    for player in active_players:
-        
-        # Player playing at any of the 5 positions
-        respective_player = deans_factors[(deans_factors['player1']==player) | (deans_factors['player2']==player) |       (deans_factors['player3']==player) | (deans_factors['player4']==player) | (deans_factors['player5']==player) ]
-        
-        #Calculating |Li|
-        combinations = len(respective_player.index)
-        
-        # calculating n
-        number_players = len(active_players)
-        
-        shapley = 1/(combinations*number_players)*(respective_player['probas'].sum())
-        
-        shapley_values[player] = shapley
+    active_players = list(active_players)
+    codes = lineup_incidence(deans_factors,active_players)
+    
+    # Player playing at any of the 5 positions --> one pass over all lineups for all players
+    member = codes >= 0
+    probas = np.broadcast_to(deans_factors['probas'].to_numpy(dtype=float)[:,None],codes.shape)
+    
+    #Calculating |Li|
+    combinations = np.bincount(codes[member],minlength=len(active_players))
+    proba_sums = np.bincount(codes[member],weights=probas[member],minlength=len(active_players))
+    
+    # calculating n
+    number_players = len(active_players)
+    
+    with np.errstate(divide='ignore',invalid='ignore'):
+        shapley = 1/(combinations*number_players)*proba_sums
+    
+    shapley_values = {player: float(value) for player, value in zip(active_players,shapley)}
         
     return shapley_values
 
-def to_shap(season,model):
+# Lineup features of the feature_cache_size most recently used (season data, roster, threshold), shared by all
+# models scored on them (older ones are built again or loaded from cache_dir)
+feature_cache = collections.OrderedDict()
+feature_cache_size = 8
+
+def feature_key(season,roster,thresh):
+    # content address: hash of the season values and columns, the roster and the activity threshold
+    digest = hashlib.sha1(pd.util.hash_pandas_object(season,index=False).to_numpy().tobytes())
+    digest.update(repr((list(season.columns),list(roster),thresh)).encode())
+    
+    return digest.hexdigest()
+
+def build_lineup_features(season,roster,thresh=40):
     # Get active roster for the season --> Threshold of max 40 games missed!
-    tmp_active = deans_factors.get_active_roster(season,roster)
+    tmp_active = deans_factors.get_active_roster(season,roster,thresh)
     
-    # Get all possible lineup combinations with active roster
-    tmp_combinations = deans_factors.get_combinations(tmp_active)
+    # Get all possible lineup combinations with active roster (each unordered lineup once,
+    # calculate_shapley credits its probability to all five members)
+    tmp_combinations = deans_factors.get_combinations(tmp_active,unique=True)
     
     # calculate deans factors for each combination for the whole season 
     game_deans = pd.DataFrame(deans_factors.deans_factors_season(season,tmp_combinations))
@@ -43,69 +110,227 @@ def to_shap(season,model):
     # Fill null values with 0 in order for the models to work
     filled_game_deans = game_deans.fillna(0)
     
+    return tmp_active, filled_game_deans
+
+def save_lineup_features(cache_dir,key,tmp_active,filled_game_deans):
+    # active players, lineups as player codes and the factor matrix as .npy files (factors written last)
+    os.makedirs(cache_dir,exist_ok=True)
+    path = os.path.join(cache_dir,key)
+    factors = filled_game_deans.drop(lineup_columns,axis=1)
+    
+    np.save(f'{path}_players.npy',np.array(tmp_active,dtype=str))
+    np.save(f'{path}_columns.npy',np.array(factors.columns,dtype=str))
+    np.save(f'{path}_lineups.npy',lineup_incidence(filled_game_deans,tmp_active).astype(np.int16))
+    np.save(f'{path}_factors.tmp.npy',factors.to_numpy(dtype=float))
+    os.replace(f'{path}_factors.tmp.npy',f'{path}_factors.npy')
+
+def load_lineup_features(cache_dir,key):
+    path = os.path.join(cache_dir,key)
+    if not os.path.exists(f'{path}_factors.npy'):
+        return None
+    
+    # factor matrix and lineups are memory mapped, not read into memory up front
+    tmp_active = np.load(f'{path}_players.npy').tolist()
+    columns = np.load(f'{path}_columns.npy').tolist()
+    lineups = np.load(f'{path}_lineups.npy',mmap_mode='r')
+    
+    filled_game_deans = pd.DataFrame(np.load(f'{path}_factors.npy',mmap_mode='r'),columns=columns)
+    players = np.array(tmp_active,dtype=object)
+    for i, column in enumerate(lineup_columns):
+        filled_game_deans.insert(i,column,players[lineups[:,i]] if len(players) else np.empty(0,dtype=object))
+    
+    return tmp_active, filled_game_deans
+
+def lineup_features(season,roster,thresh=40,cache_dir=None,profiler=NULL_PROFILER):
+    # Built once per season content, roster and threshold (optionally persisted to cache_dir as .npy memmaps)
+    with profiler.stage('feature_building'):
+        key = feature_key(season,roster,thresh)
+        
+        if key not in feature_cache:
+            features = load_lineup_features(cache_dir,key) if cache_dir else None
+            
+            if features is None:
+                features = build_lineup_features(season,roster,thresh)
+                if cache_dir:
+                    save_lineup_features(cache_dir,key,*features)
+                    
+            feature_cache[key] = features
+            if len(feature_cache) > feature_cache_size:
+                feature_cache.popitem(last=False)
+        else:
+            feature_cache.move_to_end(key)
+            profiler.count('feature_building',cache_hits=1)
+        profiler.count('feature_building',lineups=len(feature_cache[key][1].index))
+    
+    return feature_cache[key]
+
+def shapley_from_features(tmp_active,filled_game_deans,model,profiler=NULL_PROFILER):
     # return the probabililites of winning game according to each coalition
-    probas = calculate_probas(filled_game_deans,model)
+    with profiler.stage('model_scoring'):
+        probas = calculate_probas(filled_game_deans,model)
+        profiler.count('model_scoring',predictions=len(probas))
     
-    filled_game_deans['probas'] = probas
+    with profiler.stage('shapley_aggregation'):
+        filled_game_deans = filled_game_deans.assign(probas=probas)
+        
+        shapley_values = calculate_shapley(filled_game_deans,tmp_active)
+        profiler.count('shapley_aggregation',lineups=len(probas),players=len(tmp_active))
+    
+    return shapley_values
+
+def to_shap(season,model,roster,cache_dir=None,profiler=None):
+    # profiler (profiling.Profiler): per stage timings and counters, printed at the end
+    profiler = profiler or NULL_PROFILER
     
-    shapley_values = calculate_shapley(filled_game_deans,tmp_active)
+    # the lineup features are shared by every model run on the same season (see lineup_features)
+    tmp_active, filled_game_deans = lineup_features(season,roster,cache_dir=cache_dir,profiler=profiler)
+    shapley_values = shapley_from_features(tmp_active,filled_game_deans,model,profiler)
+    
+    if profiler.enabled:
+        print(profiler.report(f'to_shap {type(model).__name__}'))
     
     return shapley_values
 
-def calculate_probas_xgb(deans_factors,model):
-    probas = []
-    for i, row in deans_factors.iterrows():
-        probas.append(model.predict_proba([row[5:]])[0][1])
-    return probas
+def sample_lineups(number_players,size,rng):
+    # First five players of random roster permutations --> uniformly drawn 5-man lineups (as player codes)
+    return np.argsort(rng.random((size,number_players)),axis=1)[:,:5]
 
-def to_shap_xgb(season,model):
+def to_shap_sampled(season,model,roster,target_se=1e-4,batch_size=5000,max_lineups=1000000,confidence=0.95,seed=None,profiler=None):
+    # Monte Carlo counterpart of to_shap for large rosters: lineups are sampled until the standard
+    # error of every player's value is below target_se (or max_lineups were scored)
+    profiler = profiler or NULL_PROFILER
     tmp_active = deans_factors.get_active_roster(season,roster)
+    number_players = len(tmp_active)
     
-    tmp_combinations = deans_factors.get_combinations(tmp_active)
+    counts = np.zeros(number_players)
+    sums = np.zeros(number_players)
+    squares = np.zeros(number_players)
     
-    game_deans = pd.DataFrame(deans_factors.deans_factors_season(season,tmp_combinations))
+    if number_players >= 5:
+        # per player season means are computed once and reused for every batch
+        with profiler.stage('season_means'):
+            means = deans_factors.season_means(season,tmp_active)
+            profiler.count('season_means',players=number_players)
+        rng = np.random.default_rng(seed)
+        sampled = 0
+        
+        while sampled < max_lineups:
+            with profiler.stage('feature_building'):
+                codes = sample_lineups(number_players,min(batch_size,max_lineups-sampled),rng)
+                
+                game_deans = pd.DataFrame(deans_factors.deans_factors_matrix(deans_factors.lineup_sums(means,codes)))
+                profiler.count('feature_building',lineups=len(codes))
+            
+            with profiler.stage('model_scoring'):
+                probas = np.repeat(calculate_probas(game_deans.fillna(0),model),5)
+                profiler.count('model_scoring',predictions=len(codes))
+            
+            with profiler.stage('shapley_aggregation'):
+                counts += np.bincount(codes.ravel(),minlength=number_players)
+                sums += np.bincount(codes.ravel(),weights=probas,minlength=number_players)
+                squares += np.bincount(codes.ravel(),weights=probas**2,minlength=number_players)
+                profiler.count('shapley_aggregation',lineups=len(codes))
+            sampled += len(codes)
+            
+            with np.errstate(divide='ignore',invalid='ignore'):
+                variance = (squares-sums**2/counts)/(counts-1)
+                se = np.sqrt(variance/counts)/number_players
+            
+            if np.all(counts > 1) and np.nanmax(se) <= target_se:
+                break
     
-    filled_game_deans = game_deans.fillna(0)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        shapley = sums/counts/number_players
+        se = np.sqrt((squares-sums**2/counts)/(counts-1)/counts)/number_players
+    
+    # Normal approximation confidence intervals
+    z = NormalDist().inv_cdf(0.5+confidence/2)
+    
+    shapley_values = pd.DataFrame({'shapley': shapley, 'se': se, 'ci_low': shapley-z*se, 'ci_high': shapley+z*se,
+                                   'lineups': counts.astype(int)}, index=pd.Index(tmp_active,name='player'))
+    
+    if profiler.enabled:
+        print(profiler.report(f'to_shap_sampled {type(model).__name__}'))
+    
+    return shapley_values
+
+def calculate_shapley_grouped(deans_factors,by=()):
+    # calculate_shapley for every group of the by columns at once: players of a group get the mean win
+    # probability of the group's lineups they are part of, divided by the number of players of the group
+    by = list(by)
+    members = deans_factors[by+lineup_columns+['probas']].melt(id_vars=by+['probas'],value_vars=lineup_columns,value_name='player')
+    members = members[members['player'].notna()]
+    
+    shapley_values = members.groupby(by+['player'],sort=False)['probas'].agg(['sum','count']).reset_index()
+    if by:
+        shapley_values = shapley_values.join(members.groupby(by)['player'].nunique().rename('players'),on=by)
+    else:
+        shapley_values['players'] = members['player'].nunique()
     
-    filled_game_deans = filled_game_deans.rename(renaming,axis='columns')
+    shapley_values['shapley'] = shapley_values['sum']/(shapley_values['count']*shapley_values['players'])
     
-    filled_game_deans_tmp = filled_game_deans.drop(['player1','player2','player3','player4','player5'], axis=1)
+    return shapley_values.rename(columns={'count':'lineups'})[by+['player','shapley','lineups']]
+
+def to_shap_stints(stints,model,by=(),min_events=0,profiler=None):
+    # Shapley values from the on-court lineup stints (season_store.read_stints) instead of all combinations of
+    # the active roster: by=() per season, ('game_id',) per game, ('game_id','stint') per stint.
+    # Lineups with fewer than min_events events (within a group) are left out
+    profiler = profiler or NULL_PROFILER
+    
+    with profiler.stage('feature_building'):
+        game_deans = pd.DataFrame(deans_factors.deans_factors_stints(stints,by))
+        game_deans = game_deans[game_deans['events']>=min_events].drop(columns=['events'])
+        
+        # short stints often have empty denominators (e.g. free throws without field goal attempts) --> 0 like NaN.
+        # Only the factors, the empty slots of lineups with fewer than 5 players stay missing
+        factors = [column for column in game_deans.columns if column not in list(by)+lineup_columns]
+        game_deans[factors] = game_deans[factors].replace([np.inf,-np.inf],np.nan).fillna(0)
+        profiler.count('feature_building',rows=len(stints.index),lineups=len(game_deans.index))
     
-    probas = model.predict_proba(filled_game_deans_tmp)[:,1]
+    with profiler.stage('model_scoring'):
+        game_deans['probas'] = calculate_probas(game_deans.drop(columns=list(by)),model)
+        profiler.count('model_scoring',predictions=len(game_deans.index))
     
-    filled_game_deans['probas'] = probas
+    with profiler.stage('shapley_aggregation'):
+        shapley_values = calculate_shapley_grouped(game_deans,by)
+        profiler.count('shapley_aggregation',lineups=len(game_deans.index))
     
-    shapley_values = calculate_shapley(filled_game_deans,tmp_active)
+    if profiler.enabled:
+        print(profiler.report(f'to_shap_stints {type(model).__name__}'))
     
     return shapley_values
 
+# xgboost goes through the same batched scoring path
+calculate_probas_xgb = calculate_probas
 
-# load season data for players 
-season = pd.read_csv('lakers_season_18_19_absolute.csv')
+def to_shap_xgb(season,model,roster,cache_dir=None,profiler=None):
+    return to_shap(season,model,roster,cache_dir,profiler)
 
-# Get active roster for respective season 
-roster = pd.read_csv('lakers_rosters.csv',sep=';')
-roster = roster[roster['Season']=='18_19']['Player']
 
-# Column name matching (Necessary for xgboost model)
-renaming = {'off_fg_perc': 'off_eff_fg_perc', 'def_fg_perc': 'def_eff_fg_perc','off_to_perc':'off_tov_perc','def_to_perc':'def_tov_perc','off_rb_perc':'off_reb_perc','def_rb_perc':'def_reb_perc','off_ft_factor':'off_free_throw_factor','def_ft_factor':'def_free_throw_factor'}
+if __name__ == '__main__':
+    # load season data for players 
+    season = pd.read_csv('lakers_season_18_19_absolute.csv')
+
+    # Get active roster for respective season 
+    roster = pd.read_csv('lakers_rosters.csv',sep=';')
+    roster = roster[roster['Season']=='18_19']['Player']
+
+    # importing different models
+    model_log_reg = pickle.load(open('logreg_game_outcome_v2.pkl', 'rb'))
+    model_dec_tree = pickle.load(open('dtree_game_outcome_v1.pkl', 'rb'))
+    model_xgbcl = pickle.load(open('xgbcl_game_outcome_v1.pkl', 'rb'))
+
+    # Calculate SHAP values for all three models
+    log_reg_shap_values = to_shap(season,model_log_reg,roster)
+    xgb_shap_values = to_shap_xgb(season,model_xgbcl,roster)
+    shap_values_dec_tree = to_shap(season,model_dec_tree,roster)
+
+    # Parsing results into dataframe 
+    log_reg_shap_values = pd.DataFrame(log_reg_shap_values,index=[0])
+    xgb_shap_values = pd.DataFrame(xgb_shap_values,index=[0])
+    dec_tree_shap_values = pd.DataFrame(shap_values_dec_tree,index=[0])
 
-# importing different models
-model_log_reg = pickle.load(open('logreg_game_outcome_v2.pkl', 'rb'))
-model_dec_tree = pickle.load(open('dtree_game_outcome_v1.pkl', 'rb'))
-model_xgbcl = pickle.load(open('xgbcl_game_outcome_v1.pkl', 'rb'))
-
-# Calculate SHAP values for all three models
-log_reg_shap_values = to_shap(season,model_log_reg)
-xgb_shap_values = to_shap_xgb(season,model_xgbcl)
-shap_values_dec_tree = to_shap(season,model_dec_tree)
-
-# Parsing results into dataframe 
-log_reg_shap_values = pd.DataFrame(log_reg_shap_values,index=[0])
-xgb_shap_values = pd.DataFrame(xgb_shap_values,index=[0])
-dec_tree_shap_values = pd.DataFrame(shap_values_dec_tree,index=[0])
-
-# Exporting data to csv for all three models
-log_reg_shap_values.to_csv('log_reg_shap_lakers_18_19.csv')
-dec_tree_shap_values.to_csv('dec_tree_shap_lakers_18_19.csv')
-xgb_shap_values.to_csv('xgbcl_shap_lakers_18_19.csv')
\ No newline at end of file
+    # Exporting data to csv for all three models
+    log_reg_shap_values.to_csv('log_reg_shap_lakers_18_19.csv')
+    dec_tree_shap_values.to_csv('dec_tree_shap_lakers_18_19.csv')
+    xgb_shap_values.to_csv('xgbcl_shap_lakers_18_19.csv')
@@ -0,0 +1,251 @@
+import json
+
+import numpy as np
+
+# The pickled game outcome models compiled into plain NumPy arrays:
+#   scorer = compile_model(model)
+#   probas = scorer.predict_proba(features)[:,1]
+# Scorers only need NumPy (no sklearn / xgboost import when a worker unpickles them) and have the
+# predict_proba / feature_names_in_ interface of the models, so calculate_probas takes both.
+# verify compares a scorer with the model's own predict_proba
+
+
+def sigmoid(margin):
+    return 1/(1+np.exp(-margin))
+
+
+class LinearScorer:
+    # logistic regression: sigmoid of the dot product with the coefficients plus the intercept
+    def __init__(self,coef,intercept,feature_names_in_=None):
+        self.coef = coef
+        self.intercept = intercept
+        self.feature_names_in_ = feature_names_in_
+
+    def predict_proba(self,X):
+        proba = sigmoid(np.asarray(X,dtype=float)@self.coef+self.intercept)
+        return np.column_stack([1-proba,proba])
+
+
+class TreeScorer:
+    # one or more binary trees in flat arrays (nodes of all trees one after the other, roots: first node of each tree).
+    # Leaves point to themselves, so all rows are moved down all trees at once in max depth steps.
+    # Rows go left on x <= threshold (sklearn) or x < threshold (xgboost), missing values to the default side.
+    # The probability is the sum of the leaf values plus base_margin, through the sigmoid if logistic
+    def __init__(self,children,feature,threshold,default_left,value,roots,depth,strict=False,
+                 base_margin=0.0,logistic=False,feature_names_in_=None):
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.strict = strict
+        self.base_margin = base_margin
+        self.logistic = logistic
+        self.feature_names_in_ = feature_names_in_
+
+    def leaves(self,X,block_size=2048):
+        # leaf of every row (rows x trees), in blocks of rows so the node arrays stay in the cache.
+        # Flat take indexing: feature j of row i at i*features+j, children of node k at 2k (left) and 2k+1 (right)
+        X = np.ascontiguousarray(X,dtype=np.float32)
+        missing = np.isnan(X).any()
+        leaves = np.empty((len(X),len(self.roots)),dtype=np.int32)
+
+        for start in range(0,len(X),block_size):
+            block = X[start:start+block_size]
+            flat = block.ravel()
+            offsets = (np.arange(len(block),dtype=np.int32)*X.shape[1])[:,None]
+
+            node = np.repeat(self.roots[None,:],len(block),axis=0)
+            for _ in range(self.depth):
+                x = flat.take(offsets+self.feature.take(node))
+                threshold = self.threshold.take(node)
+                go_right = x >= threshold if self.strict else x > threshold
+                if missing:
+                    go_right = np.where(np.isnan(x),~self.default_left.take(node),go_right)
+                node = self.children.take(2*node+go_right)
+
+            leaves[start:start+block_size] = node
+
+        return leaves
+
+    def predict_proba(self,X):
+        proba = self.value[self.leaves(X)].sum(axis=1)+self.base_margin
+        if self.logistic:
+            proba = sigmoid(proba)
+        return np.column_stack([1-proba,proba])
+
+
+def float32_threshold(threshold):
+    # float32 x <= threshold exactly when x <= the largest float32 not above threshold
+    rounded = threshold.astype(np.float32)
+    return np.where(rounded > threshold,np.nextafter(rounded,np.float32(-np.inf)),rounded)
+
+
+def flat_tree(left,right,feature,threshold,offset=0):
+    # interleaved children (left, right) shifted by offset, leaves (child -1) pointing to themselves with feature 0
+    nodes = np.arange(len(left))+offset
+    leaf = left == -1
+    children = np.column_stack([np.where(leaf,nodes,left+offset),np.where(leaf,nodes,right+offset)]).ravel()
+
+    return children, np.where(leaf,0,feature), np.where(leaf,np.inf,threshold)
+
+
+def node_depth(left,right):
+    # depth of the deepest leaf of a tree (root at node 0)
+    depth = np.zeros(len(left),dtype=int)
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node]+1
+    return int(depth.max())
+
+
+def compile_logistic_regression(model):
+    if len(model.classes_) != 2:
+        raise ValueError('only binary game outcome models can be compiled')
+
+    coef = np.asarray(model.coef_,dtype=float)[0]
+    intercept = float(model.intercept_[0])
+
+    # binary multinomial fits: softmax over (-decision, decision). multi_class defaults to 'deprecated' from
+    # sklearn 1.5 on (same as 'auto') and newer versions drop it
+    multi_class = getattr(model,'multi_class','auto')
+    ovr = multi_class in ('ovr','warn') or (multi_class in ('auto','deprecated') and (len(model.classes_) <= 2 or model.solver == 'liblinear'))
+    if not ovr:
+        coef, intercept = 2*coef, 2*intercept
+
+    return LinearScorer(coef,intercept,getattr(model,'feature_names_in_',None))
+
+
+def compile_decision_tree(model):
+    if len(model.classes_) != 2:
+        raise ValueError('only binary game outcome models can be compiled')
+
+    tree = model.tree_
+    children, feature, threshold = flat_tree(tree.children_left,tree.children_right,tree.feature,tree.threshold)
+
+    # class probabilities of the leaves (node class weights normalized like DecisionTreeClassifier.predict_proba)
+    value = tree.value[:,0,:]
+    total = value.sum(axis=1)
+    total[total == 0] = 1
+    value = value[:,1]/total
+
+    # sklearn compares float32 features with float64 thresholds
+    return TreeScorer(children.astype(np.int32),feature.astype(np.int32),float32_threshold(threshold),
+                      np.zeros(len(value),dtype=bool),value,np.zeros(1,dtype=np.int32),
+                      node_depth(tree.children_left,tree.children_right),feature_names_in_=getattr(model,'feature_names_in_',None))
+
+
+def compile_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw('json'))['learner']
+
+    if learner['objective']['name'] != 'binary:logistic':
+        raise ValueError(f'xgboost objective {learner["objective"]["name"]} can not be compiled')
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f'xgboost booster {learner["gradient_booster"]["name"]} can not be compiled')
+
+    trees = learner['gradient_booster']['model']['trees']
+
+    # trees of the iterations predict_proba uses (up to the best iteration after early stopping)
+    best_iteration = getattr(model,'best_iteration',None)
+    if best_iteration is not None:
+        parallel = int(learner['gradient_booster']['model']['gbtree_model_param']['num_parallel_tree'])
+        trees = trees[:(best_iteration+1)*parallel]
+
+    arrays = [[],[],[],[],[]]
+    roots, depth, offset = [], 0, 0
+    for tree in trees:
+        if any(tree['split_type']):
+            raise ValueError('xgboost models with categorical splits can not be compiled')
+
+        left = np.array(tree['left_children'],dtype=int)
+        right = np.array(tree['right_children'],dtype=int)
+        # split_conditions holds the leaf value at leaves
+        conditions = np.array(tree['split_conditions'],dtype=np.float32)
+
+        columns = flat_tree(left,right,np.array(tree['split_indices'],dtype=int),conditions,offset)
+        columns += (np.array(tree['default_left'],dtype=bool),np.where(left == -1,conditions.astype(float),0.0))
+        for values, column in zip(arrays,columns):
+            values.append(column)
+
+        roots.append(offset)
+        depth = max(depth,node_depth(left,right))
+        offset += len(left)
+
+    children, feature, threshold, default_left, value = (np.concatenate(values) for values in arrays)
+
+    # base_score is a probability for binary:logistic (a '[5E-1]' vector string in newer versions)
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+
+    return TreeScorer(children.astype(np.int32),feature.astype(np.int32),threshold.astype(np.float32),default_left,
+                      value,np.array(roots,dtype=np.int32),depth,strict=True,
+                      base_margin=float(np.log(base_score/(1-base_score))),logistic=True,
+                      feature_names_in_=getattr(model,'feature_names_in_',None))
+
+
+def compile_model(model):
+    # the estimator's class decides the compiler, without importing sklearn or xgboost here
+    name = type(model).__name__
+    if name == 'LogisticRegression':
+        return compile_logistic_regression(model)
+    if name == 'DecisionTreeClassifier':
+        return compile_decision_tree(model)
+    if name == 'XGBClassifier':
+        return compile_xgboost(model)
+
+    raise ValueError(f'no compiled scorer for {name}')
+
+
+def verify(model,scorer,X,atol=1e-6):
+    # largest absolute difference of the win probabilities of scorer and model on X, ValueError above atol
+    difference = float(np.max(np.abs(scorer.predict_proba(X)[:,1]-model.predict_proba(X)[:,1]),initial=0))
+    if difference > atol:
+        raise ValueError(f'compiled {type(model).__name__} differs from predict_proba by {difference:.3g}')
+
+    return difference
+
+
+def verify_fitted_logistic_regression(rng,atol=1e-12):
+    # freshly fitted logistic regressions of the installed sklearn (its multi_class default, explicit ovr and
+    # multinomial) against their predict_proba, not only the pickled model
+    from sklearn.linear_model import LogisticRegression
+
+    X = rng.normal(size=(2000,8))
+    y = (X@rng.normal(size=8)+rng.normal(size=2000) > 0).astype(float)
+
+    differences = {}
+    for multi_class in [None,'ovr','multinomial']:
+        params = {} if multi_class is None else {'multi_class': multi_class}
+        try:
+            model = LogisticRegression(**params).fit(X,y)
+        except (TypeError,ValueError):
+            # multi_class removed in this sklearn version
+            continue
+        differences[multi_class or 'default'] = verify(model,compile_model(model),X,atol)
+
+    return differences
+
+
+if __name__ == '__main__':
+    # equivalence of the compiled scorers with the pickled models, on random feature rows around the
+    # Dean's factor ranges and on rows with missing values
+    import pickle
+    import warnings
+    import pandas as pd
+    warnings.filterwarnings('ignore')
+
+    rng = np.random.default_rng(0)
+    for multi_class, difference in verify_fitted_logistic_regression(rng).items():
+        print(f'fitted LogisticRegression ({multi_class}): max abs difference {difference:.3g}')
+
+    for path in ['logreg_game_outcome_v2.pkl','dtree_game_outcome_v1.pkl','xgbcl_game_outcome_v1.pkl']:
+        with open(path,'rb') as f:
+            model = pickle.load(f)
+        scorer = compile_model(model)
+
+        X = pd.DataFrame(rng.uniform(0,1,(100000,model.n_features_in_)),columns=model.feature_names_in_)
+        if type(model).__name__ == 'XGBClassifier':
+            X = X.mask(rng.random(X.shape) < 0.05)
+        print(f'{path}: max abs difference {verify(model, scorer, X):.3g}')
@@ -0,0 +1,135 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Absolute values of the team seasons in long format, one row per (game_id, player, stat) with its value and
+# the game result. data_sourcing writes them as Parquet partitioned by team and season, player and stat are
+# dictionary encoded. The functions below also accept a wide season table ({player}_{stat} columns, the csv files),
+# existing csv files are converted into the store with migrate_csv (python season_store.py --help)
+
+# Absolute stats sourced per player and game
+STATS = ['twopointers','threepointers','misses_two','misses_three','opp_twopointers','opp_threepointers',
+         'opp_misses_two','opp_misses_three','turnovers','forced_turnovers','freethrows','misses_freethrow',
+         'offensive_rebounds','defensive_rebounds','opp_freethrows','opp_misses_freethrow',
+         'opp_offensive_rebounds','opp_defensive_rebounds']
+
+LONG_COLUMNS = ['game_id','player','stat','value','win']
+
+def read_season(store,team,season,players=None):
+    # team / season (and players) filters are pushed down to the Parquet reader, only matching files are read
+    filters = [('team','==',team),('season','==',season)]
+    if players is not None:
+        filters.append(('player','in',list(players)))
+
+    return pd.read_parquet(store,columns=LONG_COLUMNS,filters=filters)
+
+def read_seasons(store,team,seasons=None):
+    # several (or all) seasons of a team in one read, with a season column
+    filters = [('team','==',team)]
+    if seasons is not None:
+        filters.append(('season','in',list(seasons)))
+
+    return pd.read_parquet(store,columns=LONG_COLUMNS+['season'],filters=filters)
+
+def read_stints(store,team,season):
+    # lineup stints of a team season (data_sourcing.source_stints): game_id, stint, events, player1..5, the stats and win
+    return pd.read_parquet(store,filters=[('team','==',team),('season','==',season)]).drop(columns=['team','season'])
+
+def is_long(season):
+    return 'stat' in season.columns
+
+def from_wide(season):
+    # wide season table --> long rows of the games each player was active in
+    split = {}
+    for column in season.columns:
+        for stat in STATS:
+            if column.endswith(f'_{stat}') and not column[:-len(stat)-1].endswith('_opp'):
+                split[column] = (column[:-len(stat)-1],stat)
+
+    long = season.melt(id_vars=['game_id','win'],value_vars=list(split),var_name='column').dropna(subset=['value'])
+    long['player'] = [split[column][0] for column in long['column']]
+    long['stat'] = [split[column][1] for column in long['column']]
+
+    long = long.astype({'player':'category','stat':pd.CategoricalDtype(STATS),'value':'int32'})
+    return long[LONG_COLUMNS].reset_index(drop=True)
+
+def write_partitions(data,store,partition_cols=('team','season')):
+    # Writer of the Parquet outputs of the folder (season store, shapley values), the same as data_sourcing's:
+    # data appended to the store partitioned by partition_cols (columns of data), a rerun replaces the partitions it writes
+    data.to_parquet(store,partition_cols=list(partition_cols),index=False,existing_data_behavior='delete_matching')
+
+def migrate_csv(path,store,team,season):
+    # wide csv file of the earlier data_sourcing versions --> long rows in the store (game ids keep their leading zeros)
+    wide = pd.read_csv(path,index_col=0,dtype={'game_id':str})
+    long = from_wide(wide).astype({'win':'int8'})
+    write_partitions(long.assign(team=team,season=season),store)
+
+    return long
+
+def players(season):
+    # players with at least one active game (in roster order)
+    if is_long(season):
+        present = set(season['player'].astype(object))
+        order = season['player'].cat.categories if season['player'].dtype == 'category' else season['player'].unique()
+        return [player for player in order if player in present]
+
+    return [column[:-len('_twopointers')] for column in season.columns
+            if column.endswith('_twopointers') and not column.endswith('_opp_twopointers') and season[column].notna().any()]
+
+def season_activity(season):
+    # games played per player of a season: rows of the long format, non-null counts of the {player}_twopointers columns
+    if is_long(season):
+        return season.loc[season['stat']=='twopointers','player'].astype(object).value_counts()
+
+    columns = [column for column in season.columns if column.endswith('_twopointers') and not column.endswith('_opp_twopointers')]
+    played = season[columns].notna().sum()
+    played.index = [column[:-len('_twopointers')] for column in columns]
+
+    return played
+
+def activity_index(seasons):
+    # players x seasons table of games played, computed once and reused for any threshold (see active_rosters).
+    # seasons: {season: season data} (long or wide) or a long frame with a season column (read_seasons)
+    if isinstance(seasons,pd.DataFrame):
+        data = seasons[seasons['stat']=='twopointers']
+        return pd.crosstab(data['player'].astype(object),data['season'].astype(object))
+
+    return pd.DataFrame({name: season_activity(data) for name, data in seasons.items()}).fillna(0).astype(int)
+
+def active_rosters(index,thresholds):
+    # players x (thresh, season) table: active (at least thresh games) for every threshold and season in one comparison
+    thresholds = np.atleast_1d(thresholds)
+    active = index.to_numpy()[:,None,:] >= thresholds[None,:,None]
+    columns = pd.MultiIndex.from_product([thresholds,index.columns],names=['thresh','season'])
+
+    return pd.DataFrame(active.reshape(len(index.index),-1),index=index.index,columns=columns)
+
+def games_played(season,players,activity=None):
+    # number of games every player (in the order of players) was active in, activity: season_activity of season
+    if activity is None:
+        activity = season_activity(season)
+
+    return activity.reindex(list(players),fill_value=0).to_numpy()
+
+def player_means(season,players):
+    # players x stats matrix of the per game season means over the games each player was active in
+    if is_long(season):
+        data = season[season['player'].isin(players)]
+        means = data.groupby([data['player'].astype(object),data['stat'].astype(object)])['value'].mean().unstack('stat')
+        return means.reindex(index=list(players),columns=STATS).to_numpy(dtype=float)
+
+    columns = [f'{player}_{stat}' for player in players for stat in STATS]
+    return season[columns].astype(float).mean().to_numpy().reshape(len(players),len(STATS))
+
+if __name__ == '__main__':
+    # e.g. python season_store.py lakers_season_18_19_absolute.csv --team LAL --season 18_19
+    parser = argparse.ArgumentParser(description='Convert a wide season csv file into the long format season store')
+    parser.add_argument('csv',type=str)
+    parser.add_argument('--team',type=str,required=True,help='team abbreviation, e.g. LAL')
+    parser.add_argument('--season',type=str,required=True,help='season as in the rosters, e.g. 18_19')
+    parser.add_argument('--store',type=str,default='season_absolute_values')
+    args = parser.parse_args()
+
+    long = migrate_csv(args.csv,args.store,args.team,args.season)
+    print(f'{len(long.index)} rows of {long["player"].nunique()} players written to {args.store} ({args.team} {args.season})')
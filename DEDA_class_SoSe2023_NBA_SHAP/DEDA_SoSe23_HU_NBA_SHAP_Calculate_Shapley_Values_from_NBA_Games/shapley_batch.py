@@ -0,0 +1,150 @@
+import argparse
+import itertools
+import logging
+import multiprocessing
+import pickle
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import calculate_shapley
+import scorers
+import season_store
+warnings.filterwarnings('ignore')
+
+# Pickled game outcome models the batch runner can score with
+MODELS = {'log_reg': 'logreg_game_outcome_v2.pkl','dec_tree': 'dtree_game_outcome_v1.pkl','xgbcl': 'xgbcl_game_outcome_v1.pkl'}
+
+# Models of a worker process (see set_models)
+loaded_models = {}
+
+
+def load_models(model_names,compiled=True):
+    # name --> model, compiled into a NumPy scorer (scorers.compile_model) unless compiled is False
+    models = {}
+    for name in model_names:
+        with open(MODELS[name],'rb') as f:
+            models[name] = pickle.load(f)
+        if compiled:
+            models[name] = scorers.compile_model(models[name])
+    return models
+
+
+def set_models(models):
+    loaded_models.update(models)
+
+
+def load_season(team,season,store=None):
+    # Long format Parquet store of data_sourcing (team abbreviation, e.g. LAL), its players are the roster
+    if store:
+        season_data = season_store.read_season(store,team,season)
+        return season_data, season_store.players(season_data)
+
+    # Wide csv files: {team}_season_{season}_absolute.csv and {team}_rosters.csv
+    season_data = pd.read_csv(f'{team}_season_{season}_absolute.csv')
+
+    roster = pd.read_csv(f'{team}_rosters.csv',sep=';')
+    roster = roster[roster['Season'] == season]['Player']
+
+    return season_data, roster
+
+
+def run_team_season(team,season,model_names,store=None,thresh=40):
+    season_data, roster = load_season(team,season,store)
+
+    # Lineup features of a team season are built once and shared by all of its models
+    tmp_active, filled_game_deans = calculate_shapley.lineup_features(season_data,roster,thresh)
+
+    results = []
+    for name in model_names:
+        shapley_values = calculate_shapley.shapley_from_features(tmp_active,filled_game_deans,loaded_models[name])
+
+        results.append(pd.DataFrame({'team': team,'season': season,'model': name,
+                                     'player': list(shapley_values.keys()),
+                                     'shapley': list(shapley_values.values())}))
+
+    return pd.concat(results,ignore_index=True)
+
+
+def run_jobs(jobs,workers=None,output='shapley_values',store=None,compiled=True,thresh=40):
+    # jobs are (team, season, model) triples, grouped per team season for the workers
+    grouped = {}
+    for team, season, model in jobs:
+        if model not in grouped.setdefault((team,season),[]):
+            grouped[(team,season)].append(model)
+
+    model_names = sorted({model for team,season,model in jobs})
+
+    # Models are loaded (and compiled) once here and sent to the workers, compiled scorers are plain NumPy arrays
+    # so the workers neither unpickle estimators nor import sklearn / xgboost
+    models = load_models(model_names,compiled)
+
+    # spawned (not forked) workers, so no xgboost / OpenMP thread state is inherited from the parent
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=workers,mp_context=context,initializer=set_models,
+                             initargs=(models,)) as pool:
+        futures = {pool.submit(run_team_season,team,season,names,store,thresh): (team,season,names)
+                   for (team,season),names in grouped.items()}
+
+        # a failing team season is logged and skipped, the others are still written
+        results, failed = {}, []
+        for future in as_completed(futures):
+            team, season, names = futures[future]
+            try:
+                results[(team,season)] = future.result()
+            except Exception:
+                logging.exception(f'{team} {season} ({", ".join(names)}) failed')
+                failed.append((team,season,names))
+
+    # e.g. no player with thresh games in a season of the store
+    for (team,season), result in results.items():
+        if result.empty:
+            logging.warning(f'{team} {season} ({", ".join(grouped[(team, season)])}): no shapley values, '
+                            f'no lineup of players active in at least {thresh} games')
+
+    # Concatenated in job order so the output does not depend on worker timing
+    results = [results[key] for key in grouped if key in results]
+    shapley_values = pd.concat(results,ignore_index=True) if results else \
+        pd.DataFrame(columns=['team','season','model','player','shapley'])
+
+    # One table partitioned by team, season and model, reruns replace their partitions
+    if output and len(shapley_values.index) > 0:
+        season_store.write_partitions(shapley_values,output,('team','season','model'))
+
+    return shapley_values, failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--teams',nargs='+',default=['lakers'],help='team file prefix, e.g. lakers (abbreviation, e.g. LAL, with --store)')
+    parser.add_argument('--seasons',nargs='+',default=['18_19'])
+    parser.add_argument('--models',nargs='+',default=list(MODELS),choices=list(MODELS))
+    parser.add_argument('--jobs',type=str,help='csv with team, season and model columns (overrides the lists)')
+    parser.add_argument('--workers',type=int,default=None)
+    parser.add_argument('--output',type=str,default='shapley_values')
+    parser.add_argument('--store',type=str,default=None,help='long format season store of data_sourcing instead of the csv files')
+    parser.add_argument('--thresh',type=int,default=40,help='games a player needs to be in the active roster')
+    parser.add_argument('--no-compile',dest='compiled',action='store_false',help='score with the estimators\' predict_proba')
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.jobs:
+        jobs = pd.read_csv(args.jobs,dtype=str)[['team','season','model']].itertuples(index=False,name=None)
+    else:
+        jobs = itertools.product(args.teams,args.seasons,args.models)
+
+    shapley_values, failed = run_jobs(list(jobs),workers=args.workers,output=args.output,store=args.store,
+                                      compiled=args.compiled,thresh=args.thresh)
+    print(f'{len(shapley_values.index)} shapley values written to {args.output}')
+    if failed:
+        print(f'{len(failed)} team seasons failed: {", ".join(f"{team} {season}" for team, season, names in failed)}')
+        sys.exit(1)
@@ -1,98 +1,116 @@
-class Player:
-    players_dict = {}
-    def __init__(self, name):
-        self.name = name
-        self.twopointers = 0
-        self.threepointers = 0
-        self.misses_two = 0
-        self.misses_three = 0
-        self.opp_twopointers = 0
-        self.opp_threepointers = 0
-        self.opp_misses_two = 0
-        self.opp_misses_three = 0
-        self.offensive_rebounds = 0
-        self.defensive_rebounds = 0
-        self.opp_offensive_rebounds = 0
-        self.opp_defensive_rebounds = 0
-        self.turnovers = 0
-        self.misses_freethrow = 0
-        self.freethrows = 0
-        self.opp_misses_freethrow = 0
-        self.opp_freethrows = 0
-        self.forced_turnovers = 0
-        Player.players_dict[name] = self
-        
-    def twopointer(self):
-        self.twopointers +=1
-        
-    def threepointer(self):
-        self.threepointers +=1
-        
-    def miss_two(self):
-        self.misses_two+=1
-        
-    def miss_three(self):
-        self.misses_three+=1
-        
-    def opp_twopointer(self):
-        self.opp_twopointers+=1
-        
-    def opp_threepointer(self):
-        self.opp_threepointers +=1
-        
-    def opp_miss_two(self):
-        self.opp_misses_two+=1
-        
-    def opp_miss_three(self):
-        self.opp_misses_three+=1
-        
-    def offensive_rebounding(self,amount):
-        self.offensive_rebounds = amount
-        
-    def defensive_rebounding(self,amount):
-        self.defensive_rebounds = amount
-        
-    def opp_offensive_rebounding(self):
-        self.opp_offensive_rebounds +=1
-        
-    def opp_defensive_rebounding(self):
-        self.opp_defensive_rebounds +=1
+import re
+import numpy as np
+from enum import IntEnum
+
+# Bump when the parsing or the accounting below changes, cached game results of older versions are recomputed
+# (2: away games were recorded as won when the home team won)
+PARSER_VERSION = 2
+
+# Counters of one player in one game, the column order of the season table
+class Stat(IntEnum):
+    twopointers = 0
+    threepointers = 1
+    misses_two = 2
+    misses_three = 3
+    opp_twopointers = 4
+    opp_threepointers = 5
+    opp_misses_two = 6
+    opp_misses_three = 7
+    turnovers = 8
+    forced_turnovers = 9
+    freethrows = 10
+    misses_freethrow = 11
+    offensive_rebounds = 12
+    defensive_rebounds = 13
+    opp_freethrows = 14
+    opp_misses_freethrow = 15
+    opp_offensive_rebounds = 16
+    opp_defensive_rebounds = 17
+
+# Stats of all players in one game, returned by player_data_calc (no state shared between games)
+# counts is an int32 (player, stat) array, players maps a name to its row
+class GameStats:
+    __slots__ = ('game_id','players','counts','win','_rows','_stats')
     
-    def turnover(self):
-        self.turnovers+=1
-        
-    def freethrow(self):
-        self.freethrows+=1
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.players = {}
+        self.counts = None
+        self.win = None
+        self._rows = []
+        self._stats = []
+        
+    def player(self, name):
+        if name not in self.players:
+            self.players[name] = len(self.players)
+        return self.players[name]
     
-    def miss_freethrow(self):
-        self.misses_freethrow+=1
-        
-    def opp_freethrow(self):
-        self.opp_freethrows+=1
+    # +1 of stat for every player of the lineup, collected and applied by finish
+    def add(self, lineup, stat):
+        for name in lineup:
+            self._rows.append(self.player(name))
+        self._stats.extend([stat]*len(lineup))
+        
+    # all increments of the game in one np.add.at
+    def finish(self):
+        self.counts = np.zeros((len(self.players),len(Stat)),dtype=np.int32)
+        np.add.at(self.counts,(np.array(self._rows,dtype=np.intp),np.array(self._stats,dtype=np.intp)),1)
+        self._rows = []
+        self._stats = []
+
+# Patterns searched in the event descriptions (compiled once)
+THREE_POINTER = re.compile(r'3PT')
+MISS = re.compile(r'MISS')
+OFF_REBOUNDS = re.compile(r'Off:\s*(\d+)')
+DEF_REBOUNDS = re.compile(r'Def:\s*(\d+)')
+
+# Vectorized parsing of all event descriptions --> typed columns used by the per event accounting
+def parse_descriptions(data):
+    three_pointer = np.zeros(len(data.index),dtype=bool)
+    miss = np.zeros(len(data.index),dtype=bool)
     
-    def opp_miss_freethrow(self):
-        self.opp_misses_freethrow+=1
-        
-    def forced_turnover(self):
-        self.forced_turnovers+=1
-        
-    def reset(self):
-        Player.players_dict = {}
+    for column in ['home_desc','neutral_desc','away_desc']:
+        text = data[column].astype(object)
+        three_pointer |= text.str.contains(THREE_POINTER,na=False).to_numpy(dtype=bool)
+        miss |= text.str.contains(MISS,na=False).to_numpy(dtype=bool)
+    
+    # rebound totals (Off:x Def:y) of the acting side's description, any number of digits
+    description = data['home_desc'].where(data['home_desc'].notna(),data['away_desc']).astype(object)
+    
+    return data.assign(three_pointer=three_pointer.astype(np.int8),
+                       miss=miss.astype(np.int8),
+                       has_rebound_totals=description.str.contains(OFF_REBOUNDS,na=False).to_numpy(dtype=np.int8),
+                       off_rebounds=description.str.extract(OFF_REBOUNDS,expand=False).fillna(0).astype(np.int16),
+                       def_rebounds=description.str.extract(DEF_REBOUNDS,expand=False).fillna(0).astype(np.int16))
+
+# Last rebound event of every (game, player), it holds the player's rebound totals of the game
+def last_rebounds(data):
+    rebounds = data[(data['game_event_type']==4) & (data['has_rebound_totals']==1)]
+    rebounds = rebounds.drop_duplicates(['game_id','player_1'],keep='last')
+    keys = zip(rebounds['game_id'],rebounds['player_1'])
+    
+    return dict(zip(keys,zip(rebounds['off_rebounds'].tolist(),rebounds['def_rebounds'].tolist())))
 
 # Handling of all player data --> Input is game data as a DataFrame
-def player_data_calc(data,roster,team):
+def player_data_calc(data,roster,team,rebounds=None):
     opponents_rebounds_off = {}
     opponents_rebounds_def = {}
-            
-    digits = ['0','1','2','3','4','5','6','7','8','9']
+    
+    if 'three_pointer' not in data.columns:
+        data = parse_descriptions(data)
+    
+    if rebounds is None:
+        rebounds = last_rebounds(data)
+    
+    game_id = data['game_id'].iloc[0]
+    home_team = data['home_team'].head(1).values[0]
+    stats = GameStats(game_id)
     
     for i, row in data.iterrows():
         
-        home_team = data['home_team'].head(1).values[0]
-        
         # Create new player if not already listed
-        if row['player_1'] not in Player.players_dict and row['player_1'] !=None:
-            Player(row['player_1'])
+        if row['player_1'] !=None:
+            stats.player(row['player_1'])
         
         
         # Indicating a shot was attempted
@@ -101,22 +119,22 @@ def player_data_calc(data,roster,team):
             # Made shots own team
             if home_team ==team and row[7]==None:
                 current_lineup = row['home_lineup']
-                handle_shots(row,current_lineup)
+                handle_shots(stats,row,current_lineup)
 
             if home_team !=team and row[5]==None:
                 current_lineup = row['away_lineup']
-                handle_shots(row,current_lineup)
+                handle_shots(stats,row,current_lineup)
 
             # Made shots opponent
             # Action by away team --> home team is our team --> action by opponent
             if home_team ==team and row[5]==None:
                 current_lineup = row['home_lineup']
-                handle_shots_opponent(row,current_lineup)
+                handle_shots_opponent(stats,row,current_lineup)
 
             # Action by home team --> Home team is not our team --> Action by opponent
             if home_team !=team and row[7]==None:
                 current_lineup = row['away_lineup']
-                handle_shots_opponent(row,current_lineup)
+                handle_shots_opponent(stats,row,current_lineup)
             
         # Handle Freethrows
         if row['game_event_type']==3 and row['player_1']!=None:
@@ -126,16 +144,16 @@ def player_data_calc(data,roster,team):
             else:  
                 current_lineup = row['away_lineup']
 
-            handle_freethrows(row,home_team,team,current_lineup)
+            handle_freethrows(stats,row,home_team,team,current_lineup)
      
         # Turnovers own team 
         
         if row['game_event_type']==5 and row['player_1']!= None:
             
-            Player.players_dict[row['player_1']].turnover()
+            stats.add([row['player_1']],Stat.turnovers)
             
         # Forced Turnovers (--> other team)
-        handle_forced_turnovers(row,team,home_team)  
+        handle_forced_turnovers(stats,row,team,home_team)  
     
     # Opponents rebounds:
         if row['game_event_type']==4 and row['player_1']!= None: 
@@ -148,122 +166,78 @@ def player_data_calc(data,roster,team):
            
             if home_team ==team and row[5]==None:
                 # Opponent is away
-                opponent_home=False
-                
-                handle_opp_rebounds_away(row,opponent_home,current_lineup,opponents_rebounds_off,opponents_rebounds_def)
+                handle_opp_rebounds(stats,row,current_lineup,opponents_rebounds_off,opponents_rebounds_def)
                 
             if home_team !=team and row[7]==None:
                 #Opponent is home
-                opponent_home=True
-
-                handle_opp_rebounds_home(row,opponent_home,current_lineup,opponents_rebounds_off,opponents_rebounds_def)
+                handle_opp_rebounds(stats,row,current_lineup,opponents_rebounds_off,opponents_rebounds_def)
     
-    # Own Rebounds
-    for player in roster:
+    stats.finish()
+    
+    # Own Rebounds (totals of the game, set instead of added), roster None --> every player of the game
+    for player in (roster if roster is not None else list(stats.players)):
         
         try:
-            if data[data['game_event_type']==4][data['player_1']==f'{player}'].shape[0]>0:
+            if (game_id,player) in rebounds:
                 
-                substring = data[data['game_event_type']==4][data['player_1']==f'{player}'].tail(1)['home_desc'].values[0]
-
-                if substring == None:
-                    substring = data[data['game_event_type']==4][data['player_1']==f'{player}'].tail(1)['away_desc'].values[0]
-
-
-                if substring != None:
-
-                    # Offensive Rebounds
-                    if substring.split("Off:",1)[1][1] in digits:
-                        offensive_rebounds = int(substring.split("Off:",1)[1][:2])
-
-                    else:
-                        offensive_rebounds = int(substring.split("Off:",1)[1][0])
-
-                    Player.players_dict[player].offensive_rebounding(offensive_rebounds)
-
-                    # Defensive Rebounds
-                    if substring.split("Def:",1)[1][1] in digits:
-                        defensive_rebounds = int(substring.split("Def:",1)[1][:2]) 
-
-                    else:
-                        defensive_rebounds = int(substring.split("Def:",1)[1][0])
+                offensive_rebounds, defensive_rebounds = rebounds[(game_id,player)]
 
-                    Player.players_dict[player].defensive_rebounding(defensive_rebounds)
+                stats.counts[stats.players[player],Stat.offensive_rebounds] = offensive_rebounds
+                stats.counts[stats.players[player],Stat.defensive_rebounds] = defensive_rebounds
 
         except KeyError:
             continue
         
-    return Player.players_dict
+    return stats
 
 
-def handle_shots(row,current_lineup):
+def handle_shots(stats,row,current_lineup):
     if row['game_event_type']==1 and row['player_1']!=None:
-        descriptions = list(row[5:8])
-
-        if any('3PT' in t for t in descriptions if t !=None):
-            Player.players_dict[row['player_1']].threepointer()
+        if row['three_pointer']:
+            stats.add([row['player_1']],Stat.threepointers)
 
         else:
-            Player.players_dict[row['player_1']].twopointer()
+            stats.add([row['player_1']],Stat.twopointers)
 
     # Misses
     if row['game_event_type']==2 and row['player_1']!= None:
-        descriptions = list(row[5:8])
-
-        if any('3PT' in t for t in descriptions if t !=None):
-            Player.players_dict[row['player_1']].miss_three()
+        if row['three_pointer']:
+            stats.add([row['player_1']],Stat.misses_three)
 
         else:
-            Player.players_dict[row['player_1']].miss_two()
+            stats.add([row['player_1']],Stat.misses_two)
                     
-def handle_shots_opponent(row,current_lineup):
+def handle_shots_opponent(stats,row,current_lineup):
     if row['game_event_type']==1 and row['player_1']!=None:
-        descriptions = list(row[5:8])
-
-        if any('3PT' in t for t in descriptions if t !=None):
+        if row['three_pointer']:
 
             
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-                Player.players_dict[player].opp_threepointer()
+            stats.add(current_lineup,Stat.opp_threepointers)
 
         else:
 
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-                Player.players_dict[player].opp_twopointer()
+            stats.add(current_lineup,Stat.opp_twopointers)
 
     # Misses
     if row['game_event_type']==2 and row['player_1']!= None:
-        descriptions = list(row[5:8])
-
-        if any('3PT' in t for t in descriptions if t !=None):
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-                Player.players_dict[player].opp_miss_three()
+        if row['three_pointer']:
+            stats.add(current_lineup,Stat.opp_misses_three)
 
         else:
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-                Player.players_dict[player].opp_miss_two()  
+            stats.add(current_lineup,Stat.opp_misses_two)
                 
                 
-def handle_freethrows(row,home_team,team,current_lineup):
+def handle_freethrows(stats,row,home_team,team,current_lineup):
     if row['game_event_type']==3 and row['player_1']!= None:
-        descriptions = list(row[5:8])
 
         if home_team ==team and row[7]==None or home_team!=team and row[5]==None:
 
     #Misses
-            if any('MISS' in t for t in descriptions if t !=None):
-                Player.players_dict[row['player_1']].miss_freethrow()
+            if row['miss']:
+                stats.add([row['player_1']],Stat.misses_freethrow)
         #Makes 
             else:
-                Player.players_dict[row['player_1']].freethrow()    
+                stats.add([row['player_1']],Stat.freethrows)
                 
         #opponents
         
@@ -271,159 +245,51 @@ def handle_freethrows(row,home_team,team,current_lineup):
         if home_team ==team and row[5]==None or home_team!=team and row[7]==None:
             
 
-            if any('MISS' in t for t in descriptions if t !=None):
-
-                for player in current_lineup:
-                    if player not in Player.players_dict:
-                        Player(player)
+            if row['miss']:
 
-                    Player.players_dict[player].opp_miss_freethrow()
+                stats.add(current_lineup,Stat.opp_misses_freethrow)
         #Makes 
             else:
-                for player in current_lineup:
-                    if player not in Player.players_dict:
-                        Player(player)
-                        
-                    Player.players_dict[player].opp_freethrow()   
+                stats.add(current_lineup,Stat.opp_freethrows)
                     
-def handle_forced_turnovers(row,team,home_team):
+def handle_forced_turnovers(stats,row,team,home_team):
     if home_team==team and row[5]==None:
 
         # Check for away team rebounds
         if row['game_event_type']==5 and row['away_desc']!=None and row['home_desc']==None:
 
-            for player in row['home_lineup']:
-
-                if player not in Player.players_dict:
-                    Player(player)
-                Player.players_dict[player].forced_turnover() 
+            stats.add(row['home_lineup'],Stat.forced_turnovers)
 
     if home_team!=team and row[7]==None:
         if row['game_event_type']==5 and row['home_desc']!=None and row['away_desc']==None:
 
-            for player in row['away_lineup']:
-
-                if player not in Player.players_dict:
-                    Player(player)
-
-                Player.players_dict[player].forced_turnover() 
-            
-def handle_opp_rebounds_home(row,opponent_home,current_lineup,opponents_rebounds_off,opponents_rebounds_def):
-    try:
-        
-        # else: Just change away_desc to home_desc every time!!!!
-        # if opponent_home:
-
-        offensive_rebounds = int(row['home_desc'].split("Off:",1)[1][0])
-
-        defensive_rebounds = int(row['home_desc'].split("Def:",1)[1][0])
-        
-        
-        if opponents_rebounds_off[row['player_1']]< offensive_rebounds:
-            opponents_rebounds_off[row['player_1']]+=1
-
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-
-                Player.players_dict[player].opp_offensive_rebounding()
-                
-        
-        if opponents_rebounds_def[row['player_1']] < defensive_rebounds:
-            opponents_rebounds_def[row['player_1']]+=1
+            stats.add(row['away_lineup'],Stat.forced_turnovers)
             
-
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-                Player.players_dict[player].opp_defensive_rebounding()
+def handle_opp_rebounds(stats,row,current_lineup,opponents_rebounds_off,opponents_rebounds_def):
+    offensive_rebounds = row['off_rebounds']
+    defensive_rebounds = row['def_rebounds']
     
-    except KeyError:
-            
-        opponents_rebounds_off[row['player_1']] = int(row['home_desc'].split("Off:",1)[1][0])
-        opponents_rebounds_def[row['player_1']] = int(row['home_desc'].split("Def:",1)[1][0])
-        
-        offensive_rebounds = int(row['home_desc'].split("Off:",1)[1][0])
-
-        defensive_rebounds = int(row['home_desc'].split("Def:",1)[1][0])
-        
-        
-        if offensive_rebounds>0:
-
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-
-                Player.players_dict[player].opp_offensive_rebounding()
-                
-        
-        if defensive_rebounds>0:
-
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-                Player.players_dict[player].opp_defensive_rebounding()
-
-
-def handle_opp_rebounds_away(row,opponent_home,current_lineup,opponents_rebounds_off,opponents_rebounds_def):
-    try:
-        # else: Just change away_desc to home_desc every time!!!!
-        # if opponent_home:
-
-        offensive_rebounds = int(row['away_desc'].split("Off:",1)[1][0])
-
-        defensive_rebounds = int(row['away_desc'].split("Def:",1)[1][0])
-        
+    if row['player_1'] in opponents_rebounds_off:
         
         if opponents_rebounds_off[row['player_1']]< offensive_rebounds:
             opponents_rebounds_off[row['player_1']]+=1
 
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-
-                Player.players_dict[player].opp_offensive_rebounding()
+            stats.add(current_lineup,Stat.opp_offensive_rebounds)
                 
-        
         if opponents_rebounds_def[row['player_1']] < defensive_rebounds:
             opponents_rebounds_def[row['player_1']]+=1
-            
-
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
 
-                Player.players_dict[player].opp_defensive_rebounding()
+            stats.add(current_lineup,Stat.opp_defensive_rebounds)
     
-    except KeyError:
-            
-        opponents_rebounds_off[row['player_1']] = int(row['away_desc'].split("Off:",1)[1][0])
-        opponents_rebounds_def[row['player_1']] = int(row['away_desc'].split("Def:",1)[1][0])
-        
-        offensive_rebounds = int(row['away_desc'].split("Off:",1)[1][0])
-
-        defensive_rebounds = int(row['away_desc'].split("Def:",1)[1][0])
-        
+    # First rebound of that opponent player in the game
+    else:
+        opponents_rebounds_off[row['player_1']] = offensive_rebounds
+        opponents_rebounds_def[row['player_1']] = defensive_rebounds
         
         if offensive_rebounds>0:
 
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-
-                Player.players_dict[player].opp_offensive_rebounding()
+            stats.add(current_lineup,Stat.opp_offensive_rebounds)
                 
-        
         if defensive_rebounds>0:
 
-            for player in current_lineup:
-                if player not in Player.players_dict:
-                    Player(player)
-
-                Player.players_dict[player].opp_defensive_rebounding()
\ No newline at end of file
+            stats.add(current_lineup,Stat.opp_defensive_rebounds)
@@ -2,138 +2,212 @@
 import abs_values
 import lineups
 import handle_absolute_values
+import game_cache
+import stints
+import profiling
 
 # External libraries
 import pandas as pd
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import cross_val_score
 import warnings
 import sqlite3
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 warnings.filterwarnings('ignore')
 
 # team = 'LAL'
 # season = '22018'
 # players_season = '18_19'
 
-def source_data(team,season,players_season):
-    conn = sqlite3.connect('nba.sqlite')
+# Play by play columns of one team season, named as used throughout the sourcing code
+PBP_QUERY = '''SELECT pbp.eventmsgtype AS game_event_type, pbp.game_id AS game_id, pbp.player1_name AS player_1, pbp.player2_name AS player_2, pbp.player3_name AS player_3,
+    pbp.homedescription AS home_desc, pbp.neutraldescription AS neutral_desc, pbp.visitordescription AS away_desc, pbp.eventnum AS game_event_id,
+    g.team_abbreviation_home AS home_team, g.team_abbreviation_away AS away_team, g.season_id AS season_id, gi.game_date AS date, g.wl_home AS wl_home
+    FROM game AS g
+    JOIN play_by_play AS pbp ON pbp.game_id = g.game_id
+    JOIN game_info gi ON pbp.game_id = gi.game_id
+    WHERE (g.team_abbreviation_home=? OR g.team_abbreviation_away=?) AND g.season_id=?
+    ORDER BY gi.game_date DESC, pbp.game_id, CAST(pbp.eventnum AS INTEGER)'''
+
+# Games of the team season with play by play data, in the order of the season table
+GAMES_QUERY = '''SELECT DISTINCT g.game_id AS game_id, gi.game_date AS date
+    FROM game AS g
+    JOIN game_info gi ON g.game_id = gi.game_id
+    WHERE (g.team_abbreviation_home=? OR g.team_abbreviation_away=?) AND g.season_id=?
+    AND EXISTS (SELECT 1 FROM play_by_play AS pbp WHERE pbp.game_id = g.game_id)
+    ORDER BY gi.game_date DESC, g.game_id'''
+
+PBP_DTYPES = {'game_event_type': 'int16', 'game_event_id': 'int32'}
+
+def create_indexes(conn):
+    # Indexes for the team/season filter and the joins, only created when missing
     c = conn.cursor()
+    c.execute('CREATE INDEX IF NOT EXISTS idx_play_by_play_game_id ON play_by_play(game_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_game_team_season ON game(team_abbreviation_home, team_abbreviation_away, season_id)')
+    # second index so the away side of the OR can be searched as well
+    c.execute('CREATE INDEX IF NOT EXISTS idx_game_away_season ON game(team_abbreviation_away, season_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_game_info_game_id ON game_info(game_id)')
+    conn.commit()
+
+def season_game_ids(conn,team,season):
+    return [game_id for game_id, date in conn.execute(GAMES_QUERY,(team,team,season))]
+
+def load_season_pbp(conn,team,season,chunksize=100000,game_ids=None):
+    # Team and season are filtered in SQL, rows are streamed in chunks into typed columns
+    query, params = PBP_QUERY, (team,team,season)
+    
+    # only some games of the season (the ones not in the game cache)
+    if game_ids is not None:
+        query = query.replace('ORDER BY',f'AND pbp.game_id IN ({",".join(["?"]*len(game_ids))})\n    ORDER BY')
+        params = params + tuple(game_ids)
+    
+    chunks = pd.read_sql_query(query,conn,params=params,chunksize=chunksize)
+    season_pbp = pd.concat([chunk.astype(PBP_DTYPES) for chunk in chunks],ignore_index=True)
+    
+    for column in ['home_team','away_team','season_id','wl_home']:
+        season_pbp[column] = season_pbp[column].astype('category')
+    
+    return season_pbp
+
+def game_stats(data_game,roster,team,rebounds=None):
+    # Self-contained statistics of one game (no shared state, so it can run in a worker process)
+    stats_game = abs_values.player_data_calc(data_game,roster,team,rebounds)
+    
+    # getting win loss column! (away games are won if the home team lost, as in stints.stint_table)
+    if data_game['home_team'].head(1).values[0] == team:
+        stats_game.win = 1 if data_game['wl_home'].iloc[0]=='W' else 0
+    else:
+        stats_game.win = 1 if data_game['wl_home'].iloc[0]=='L' else 0
+        
+    return stats_game
+
+def track_lineups(season):
+    # Getting all the various lineups for each game of that season (on play by play basis) as
+    # integer lineup ids (home_lineup_id / away_lineup_id columns), the season is partitioned into
+    # per game slices once. Returns the lineup id --> player names table
+    lineup_codes = lineups.LineupCodes()
+    home_lineup_ids = np.empty(len(season.index),dtype=np.int32)
+    away_lineup_ids = np.empty(len(season.index),dtype=np.int32)
+    
+    for game, rows in season.groupby('game_id',sort=False).indices.items():
+        home_lineup_ids[rows], away_lineup_ids[rows] = lineups.play_by_play_lineup_ids(season.iloc[rows],lineup_codes)
 
-    team = team
-    
-    # Making SQlite call to receive necessary pbp data
-    c.execute('''SELECT pbp.eventmsgtype, pbp.game_id ,pbp.player1_name, pbp.player2_name, pbp.player3_name, pbp.homedescription, pbp.neutraldescription, pbp.visitordescription,pbp.eventnum, g.team_abbreviation_home, g.team_abbreviation_away, g.season_id ,gi.game_date 
-    From play_by_play AS pbp
-    JOIN game_info gi ON pbp.game_id = gi.game_id 
-    JOIN game g ON pbp.game_id = g.game_id
-    WHERE g.team_abbreviation_home='LAL' OR g.team_abbreviation_away='LAL'
-    ORDER BY gi.game_date DESC
-    LIMIT 1000000''')
+    season['home_lineup_id'] = home_lineup_ids
+    season['away_lineup_id'] = away_lineup_ids
+    
+    return lineup_codes.table()
 
-    team_pbp = c.fetchall()
+def parse_games(season,team,workers=1,profiler=profiling.NULL_PROFILER):
+    with profiler.stage('lineup_tracking'):
+        lineup_table = track_lineups(season)
+        profiler.count('lineup_tracking',rows=len(season.index),lineups=len(lineup_table))
     
-    # inserting pbp data into DataFrame
-    team_pbp = pd.DataFrame(data=team_pbp)
-    team_pbp = team_pbp.rename(columns={0:'game_event_type',1:'game_id',2:'player_1',3:'player_2',4:'player_3',5:'home_desc',6:'neutral_desc',
-                                          7:'away_desc',8:'game_event_id',9:'home_team',10:'away_team',11:'season_id',12:'date'})
+    with profiler.stage('description_parsing'):
+        # Shot type, misses and rebound totals parsed from the descriptions for the whole season
+        season = abs_values.parse_descriptions(season)
+        
+        # Last rebound totals of every (game, player) --> own rebounds
+        rebounds = abs_values.last_rebounds(season)
+        profiler.count('description_parsing',rows=len(season.index))
     
-    #Getting season data for specific season
-    season = team_pbp[team_pbp['season_id']==season]
+    # lineup ids --> player names for the rows of each game only
+    games = (data_game.assign(home_lineup=lineup_table[data_game['home_lineup_id'].to_numpy()],
+                              away_lineup=lineup_table[data_game['away_lineup_id'].to_numpy()])
+             for game, data_game in season.groupby('game_id',sort=False))
     
-    # Getting season ids for the specific season
-    game_ids = season['game_id'].unique()
+    # Stats of every player of a game (not only the roster), so the cached games do not depend on the roster.
+    # Games are independent: with workers > 1 they are spread over a process pool, map keeps
+    # the game order so the merged season table does not depend on worker timing
+    with profiler.stage('event_accounting'):
+        if workers > 1:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers,mp_context=context) as pool:
+                results = list(pool.map(game_stats,games,repeat(None),repeat(team),chunksize=4))
+        else:
+            results = [game_stats(data_game,None,team,rebounds) for data_game in games]
+        profiler.count('event_accounting',rows=len(season.index),games=len(results))
+    
+    return results
+
+def source_data(team,season,players_season,database='nba.sqlite',chunksize=100000,workers=1,cache='game_cache.sqlite',store='season_absolute_values',csv=False,profiler=None):
+    # profiler (profiling.Profiler): per stage timings and counters, printed at the end
+    profiler = profiler or profiling.NULL_PROFILER
+    
+    with profiler.stage('sql_fetch'):
+        conn = sqlite3.connect(database)
+        create_indexes(conn)
+        game_ids = season_game_ids(conn,team,season)
+    
+    # Games already parsed by an earlier run (same parser version) come from the cache next to the
+    # database, only the new ones are read and parsed (cache=None --> every game is parsed)
+    cached = {}
+    if cache is not None:
+        with profiler.stage('cache_load'):
+            cache_conn = game_cache.connect(os.path.join(os.path.dirname(os.path.abspath(database)),cache))
+            cached = game_cache.load_games(cache_conn,team,game_ids)
+            profiler.count('cache_load',games=len(cached))
+    
+    missing = [game_id for game_id in game_ids if game_id not in cached]
+    
+    # One SQlite call for the pbp data (and game results) of the (uncached games of the) team season
+    with profiler.stage('sql_fetch'):
+        if missing:
+            season = load_season_pbp(conn,team,season,chunksize,missing if cached else None)
+            profiler.count('sql_fetch',rows=len(season.index),games=len(missing))
+        conn.close()
     
     # Getting active roster of that season
     lakers_roster = pd.read_csv('lakers_rosters.csv',sep=';')
     lakers_roster = lakers_roster[lakers_roster['Season']==players_season]['Player']
+    roster = list(lakers_roster)
     
-    game_lineups_home = []
-    game_lineups_away = []
+    new_results = parse_games(season,team,workers,profiler) if missing else []
     
-    # Getting all the various lineups for each game of that season (on play by play basis)
-    for game in game_ids:
-        game_data = season[season['game_id']==game]
-        current_lineups = lineups.play_by_play_lineup(game_data)
-        
-        game_lineups_home.append(current_lineups['lineup_home'])
-
-        game_lineups_away.append(current_lineups['lineup_away'])
-        
-
-    # Adding home and away current lineups to our data 
-    flattened_home = [item for sublist in game_lineups_home for item in sublist]
-    flattened_away = [item for sublist in game_lineups_away for item in sublist]
-
-    season['home_lineup']=flattened_home
-    season['away_lineup'] = flattened_away
+    if cache is not None:
+        with profiler.stage('cache_store'):
+            game_cache.store_games(cache_conn,team,new_results)
+            cache_conn.close()
+            profiler.count('cache_store',games=len(new_results))
     
-    c.execute('SELECT wl_home,game_id from game g')
-
-    win_loss = c.fetchall()
-
-    # Getting win/loss data for the games of that season
-    dict_win_loss = {}
-    for game in win_loss:
-        dict_win_loss[game[1]] = game[0]
-        
-    # Actually retrieving the necessary statistics for every respective player 
-    absolute_values = {}
-
-    for game in game_ids:
-
-        data_game = season[season['game_id']==game]
-        
-        opponents_rebounds_off = {}
-        opponents_rebounds_def = {}
-        
-        stats_game = abs_values.player_data_calc(data_game,lakers_roster,'LAL')
-
-        active_players = list(stats_game.keys())
+    new_results = {stats_game.game_id: stats_game for stats_game in new_results}
+    results = [cached[game_id] if game_id in cached else new_results[game_id] for game_id in game_ids]
         
-        # getting active and inactive roster for paticular game
+    # Actually retrieving the necessary statistics for every respective player of the roster, in long
+    # format (game_id, player, stat, value) into the Parquet store partitioned by team and season
+    with profiler.stage('output'):
+        if store is not None:
+            absolute_values = handle_absolute_values.season_long(results,roster)
+            handle_absolute_values.write_partitions(absolute_values.assign(team=team,season=players_season),store)
         
-        active_lakers_players = list(set(active_players) & set(lakers_roster))
-
-        inactive_players = list(set(lakers_roster)-set(active_lakers_players))
-        
-        for player in active_lakers_players:
-            
-            if player not in stats_game.keys():
-                Player(player)
-
-            handle_absolute_values.calc_absolute_values(absolute_values, stats_game,player)
-        
-        for player in inactive_players:
-            
-            # absolute values
-            handle_absolute_values.calc_absolute_values_inactive(absolute_values, stats_game,player)
-        
-        # getting win loss column!
-
-        if data_game['home_team'].head(1).values[0] == 'LAL':
-            if dict_win_loss[game]=='W':
-                absolute_values.setdefault('win',[]).append(1)
-            else:
-                absolute_values.setdefault('win',[]).append(0)
-                
-        if data_game['home_team'].head(1).values[0] != 'LAL':
-            if dict_win_loss[game]=='L':
-                absolute_values.setdefault('win',[]).append(0)
-            else:
-                absolute_values.setdefault('win',[]).append(1)
-                
-        absolute_values.setdefault('game_id',[]).append(game)
-        player_name = list(stats_game.keys())[0]
-        
-        # Reset of stats for new game
-        stats_game[player_name].reset()
+        # Wide table ({player}_{stat} columns) as csv file, as read by the earlier versions of calculate_shapley
+        if csv:
+            df_lal_season = handle_absolute_values.season_table(results,roster)
+            df_lal_season.to_csv(f'lakers_season_{players_season}_absolute.csv')
+        profiler.count('output',games=len(results))
     
-    # Saving data to dataframe
-    df_lal_season = pd.DataFrame(absolute_values)
+    if profiler.enabled:
+        print(profiler.report(f'source_data {team} {players_season}'))
     
-    # Exporting data to csv file
-    df_lal_season.to_csv(f'lakers_season_{players_season}_absolute.csv')
+def source_stints(team,season,players_season,database='nba.sqlite',chunksize=100000,store='season_stints'):
+    # Lineup stints of the team season with their team level stats (see stints.py), written to a Parquet
+    # store partitioned by team and season like the absolute values
+    conn = sqlite3.connect(database)
+    create_indexes(conn)
+    season = load_season_pbp(conn,team,season,chunksize)
+    conn.close()
     
+    lineup_table = track_lineups(season)
+    season_stints = stints.stint_table(abs_values.parse_descriptions(season),lineup_table,team)
     
+    if store is not None:
+        handle_absolute_values.write_partitions(season_stints.assign(team=team,season=players_season),store)
     
-source_data('LAL','22018','18_19')  
\ No newline at end of file
+    return season_stints
+    
+
+if __name__ == '__main__':
+    source_data('LAL','22018','18_19',csv=True)  
\ No newline at end of file
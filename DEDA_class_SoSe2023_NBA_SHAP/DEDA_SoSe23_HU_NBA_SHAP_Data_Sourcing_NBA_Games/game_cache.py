@@ -0,0 +1,58 @@
+import sqlite3
+import numpy as np
+
+from abs_values import Stat, GameStats, PARSER_VERSION
+
+# Per game results of source_data in a local SQLite file next to nba.sqlite, keyed by
+# (game_id, team, parser version): reruns only parse the games that are not cached yet
+STAT_COLUMNS = [stat.name for stat in Stat]
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS cached_game (game_id TEXT, team TEXT, parser_version INTEGER, win INTEGER,
+                 PRIMARY KEY (game_id, team, parser_version))''')
+    c.execute(f'''CREATE TABLE IF NOT EXISTS cached_player_stats (game_id TEXT, team TEXT, parser_version INTEGER, player TEXT,
+                  {', '.join(f'{column} INTEGER' for column in STAT_COLUMNS)},
+                  PRIMARY KEY (game_id, team, parser_version, player))''')
+    conn.commit()
+    return conn
+
+def load_games(conn,team,game_ids,parser_version=PARSER_VERSION):
+    # game_id --> GameStats of the cached games among game_ids
+    c = conn.cursor()
+    c.execute('CREATE TEMP TABLE IF NOT EXISTS wanted_game (game_id TEXT PRIMARY KEY)')
+    c.execute('DELETE FROM wanted_game')
+    c.executemany('INSERT OR IGNORE INTO wanted_game VALUES (?)',[(str(game_id),) for game_id in game_ids])
+
+    games = {}
+    for game_id, win in c.execute('''SELECT cg.game_id, cg.win FROM cached_game AS cg JOIN wanted_game AS w ON w.game_id = cg.game_id
+                                     WHERE cg.team=? AND cg.parser_version=?''',(team,parser_version)):
+        games[game_id] = GameStats(game_id)
+        games[game_id].win = win
+        games[game_id].counts = []
+
+    for row in c.execute(f'''SELECT ps.game_id, ps.player, {', '.join(f'ps.{column}' for column in STAT_COLUMNS)}
+                             FROM cached_player_stats AS ps JOIN wanted_game AS w ON w.game_id = ps.game_id
+                             WHERE ps.team=? AND ps.parser_version=?''',(team,parser_version)):
+        # player rows without their game row are left over from an interrupted store
+        if row[0] not in games:
+            continue
+        stats_game = games[row[0]]
+        stats_game.player(row[1])
+        stats_game.counts.append(row[2:])
+
+    for stats_game in games.values():
+        stats_game.counts = np.array(stats_game.counts,dtype=np.int32).reshape(len(stats_game.players),len(Stat))
+
+    return games
+
+def store_games(conn,team,results,parser_version=PARSER_VERSION):
+    c = conn.cursor()
+    for stats_game in results:
+        game_id = str(stats_game.game_id)
+        c.execute('INSERT OR REPLACE INTO cached_game VALUES (?,?,?,?)',(game_id,team,parser_version,stats_game.win))
+        c.execute('DELETE FROM cached_player_stats WHERE game_id=? AND team=? AND parser_version=?',(game_id,team,parser_version))
+        c.executemany(f'INSERT INTO cached_player_stats VALUES ({", ".join(["?"]*(4+len(Stat)))})',
+                      [(game_id,team,parser_version,player,*stats_game.counts[row].tolist()) for player, row in stats_game.players.items()])
+    conn.commit()
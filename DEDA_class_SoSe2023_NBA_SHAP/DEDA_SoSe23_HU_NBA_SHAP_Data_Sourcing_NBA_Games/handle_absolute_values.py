@@ -1,41 +1,53 @@
-def calc_absolute_values(absolute_values, stats_game,player):
-    absolute_values.setdefault(f'{player}_twopointers', []).append(stats_game[player].twopointers)
-    absolute_values.setdefault(f'{player}_threepointers',[]).append(stats_game[player].threepointers)
-    absolute_values.setdefault(f'{player}_misses_two',[]).append(stats_game[player].misses_two)
-    absolute_values.setdefault(f'{player}_misses_three',[]).append(stats_game[player].misses_three)
-    absolute_values.setdefault(f'{player}_opp_twopointers',[]).append(stats_game[player].opp_twopointers)
-    absolute_values.setdefault(f'{player}_opp_threepointers',[]).append(stats_game[player].opp_threepointers)
-    absolute_values.setdefault(f'{player}_opp_misses_two',[]).append(stats_game[player].opp_misses_two)
-    absolute_values.setdefault(f'{player}_opp_misses_three',[]).append(stats_game[player].opp_misses_three)
-    absolute_values.setdefault(f'{player}_turnovers',[]).append(stats_game[player].turnovers)
-    absolute_values.setdefault(f'{player}_forced_turnovers',[]).append(stats_game[player].forced_turnovers)
-    absolute_values.setdefault(f'{player}_freethrows',[]).append(stats_game[player].freethrows)
-    absolute_values.setdefault(f'{player}_misses_freethrow',[]).append(stats_game[player].misses_freethrow)
-    absolute_values.setdefault(f'{player}_offensive_rebounds',[]).append(stats_game[player].offensive_rebounds)
-    absolute_values.setdefault(f'{player}_defensive_rebounds',[]).append(stats_game[player].defensive_rebounds)
-    absolute_values.setdefault(f'{player}_opp_freethrows',[]).append(stats_game[player].opp_freethrows)
-    absolute_values.setdefault(f'{player}_opp_misses_freethrow',[]).append(stats_game[player].opp_misses_freethrow)
-    absolute_values.setdefault(f'{player}_opp_offensive_rebounds',[]).append(stats_game[player].opp_offensive_rebounds)
-    absolute_values.setdefault(f'{player}_opp_defensive_rebounds',[]).append(stats_game[player].opp_defensive_rebounds)
+import numpy as np
+import pandas as pd
+
+from abs_values import Stat
+
+# int32 (game, player, stat) accumulator of the roster and the (game, player) activity mask
+def season_counts(results,roster):
+    counts = np.zeros((len(results),len(roster),len(Stat)),dtype=np.int32)
+    active = np.zeros((len(results),len(roster)),dtype=bool)
     
+    for game, stats_game in enumerate(results):
+        rows = [i for i, player in enumerate(roster) if player in stats_game.players]
+        counts[game,rows] = stats_game.counts[[stats_game.players[roster[i]] for i in rows]]
+        active[game,rows] = True
+        
+    return counts, active
+
+# Season table of the roster: one row per game, one {player}_{stat} column per player and stat,
+# players without an event in a game are missing (<NA>) for that game
+def season_table(results,roster):
+    roster = list(dict.fromkeys(roster))
+    counts, active = season_counts(results,roster)
     
-def calc_absolute_values_inactive(absolute_values, stats_game,player):
+    columns = [f'{player}_{stat.name}' for player in roster for stat in Stat]
+    values = counts.reshape(len(results),len(roster)*len(Stat))
+    missing = ~np.repeat(active,len(Stat),axis=1)
     
-    absolute_values.setdefault(f'{player}_twopointers', []).append(None)
-    absolute_values.setdefault(f'{player}_threepointers',[]).append(None)
-    absolute_values.setdefault(f'{player}_misses_two',[]).append(None)
-    absolute_values.setdefault(f'{player}_misses_three',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_twopointers',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_threepointers',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_misses_two',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_misses_three',[]).append(None)
-    absolute_values.setdefault(f'{player}_turnovers',[]).append(None)
-    absolute_values.setdefault(f'{player}_forced_turnovers',[]).append(None)
-    absolute_values.setdefault(f'{player}_freethrows',[]).append(None)
-    absolute_values.setdefault(f'{player}_misses_freethrow',[]).append(None)
-    absolute_values.setdefault(f'{player}_offensive_rebounds',[]).append(None)
-    absolute_values.setdefault(f'{player}_defensive_rebounds',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_freethrows',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_misses_freethrow',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_offensive_rebounds',[]).append(None)
-    absolute_values.setdefault(f'{player}_opp_defensive_rebounds',[]).append(None)
\ No newline at end of file
+    absolute_values = pd.DataFrame({column: pd.arrays.IntegerArray(values[:,j],missing[:,j]) for j, column in enumerate(columns)})
+    absolute_values['win'] = [stats_game.win for stats_game in results]
+    absolute_values['game_id'] = [stats_game.game_id for stats_game in results]
+    
+    return absolute_values
+
+# Long format of the same values: one (game_id, player, stat, value) row per active player, game and stat
+# (plus the game result), player and stat as categoricals --> dictionary encoded in Parquet
+def season_long(results,roster):
+    roster = list(dict.fromkeys(roster))
+    counts, active = season_counts(results,roster)
+    games, players = np.nonzero(active)
+    
+    game_ids = np.array([stats_game.game_id for stats_game in results],dtype=object)
+    wins = np.array([stats_game.win for stats_game in results],dtype=np.int8)
+    
+    return pd.DataFrame({'game_id': np.repeat(game_ids[games],len(Stat)),
+                         'player': pd.Categorical.from_codes(np.repeat(players,len(Stat)),categories=roster),
+                         'stat': pd.Categorical.from_codes(np.tile(np.arange(len(Stat)),len(games)),categories=[stat.name for stat in Stat]),
+                         'value': counts[games,players].ravel(),
+                         'win': np.repeat(wins[games],len(Stat))})
+
+# Writer of every Parquet store of the folder (long format seasons, stints): data appended to the store, partitioned
+# by partition_cols (columns of data), a rerun replaces the partitions it writes
+def write_partitions(data,store,partition_cols=('team','season')):
+    data.to_parquet(store,partition_cols=list(partition_cols),index=False,existing_data_behavior='delete_matching')
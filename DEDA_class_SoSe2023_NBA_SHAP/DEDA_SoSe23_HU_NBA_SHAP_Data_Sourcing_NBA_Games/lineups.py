@@ -1,55 +1,77 @@
+import numpy as np
 import pandas as pd
-def play_by_play_lineup(game_example):
-    lineup_home = []
-    lineup_away = []
 
-    current_lineup_home = []
-    current_lineup_away = []
+# Integer codes for 5-player sets, shared by all games of a season
+class LineupCodes:
+    def __init__(self):
+        self.ids = {}
+        self.lineups = []
 
-    # Getting starting 5
-    
-    for index, row in game_example.iterrows():
+    def code(self,lineup):
+        key = frozenset(lineup)
+        if key not in self.ids:
+            self.ids[key] = len(self.lineups)
+            self.lineups.append(tuple(lineup))
+        return self.ids[key]
 
+    # lineup id --> tuple of player names (object array, so it can be indexed with id arrays)
+    def table(self):
+        table = np.empty(len(self.lineups),dtype=object)
+        for i, lineup in enumerate(self.lineups):
+            table[i] = lineup
+        return table
 
-        if row[0]==8 or row[0]==1 or row[0]==2:
-            # Starting lineup of home team
-            if len(lineup_home)<5 and row[5]!=None and row[2] not in lineup_home:
+def play_by_play_lineup_ids(game_example,lineup_codes):
+    event_type = game_example['game_event_type'].to_numpy()
+    home_event = game_example['home_desc'].notna().to_numpy()
 
-                lineup_home.append(f'{row[2]}')
+    # player names as integer codes (-1 for no player)
+    codes, names = pd.factorize(pd.concat([game_example['player_1'],game_example['player_2']]))
+    player_1 = codes[:len(event_type)]
+    player_2 = codes[len(event_type):]
 
-            # Starting lineup of away team 
-            if len(lineup_away)<5 and row[5]==None and row[2] not in lineup_away:
+    # Getting starting 5 (home team if the event has a home description, away team otherwise)
+    lineup = {True: [],False: []}
 
-                lineup_away.append(f'{row[2]}')
-                
-        
+    for i in np.flatnonzero(np.isin(event_type,(1,2,8)) & (player_1 >= 0)):
+        if len(lineup[home_event[i]]) < 5 and player_1[i] not in lineup[home_event[i]]:
+            lineup[home_event[i]].append(player_1[i])
 
         # break if both lineups full
-        if len(lineup_home)==5 and len(lineup_away)==5:
+        if len(lineup[True]) == 5 and len(lineup[False]) == 5:
             break
 
-    for index, row in game_example.iterrows():
+    def code(players):
+        return lineup_codes.code([names[player] for player in players])
+
+    current = {True: code(lineup[True]),False: code(lineup[False])}
+    lineup_home = np.empty(len(event_type),dtype=np.int32)
+    lineup_away = np.empty(len(event_type),dtype=np.int32)
 
-        if row[0]==8 and row[5]!=None and row[2]!=None and row[3]!=None:
+    # Lineups only change at substitutions: walk those and fill the rows in between
+    start = 0
+    for i in np.flatnonzero((event_type == 8) & (player_1 >= 0) & (player_2 >= 0)):
+        lineup_home[start:i] = current[True]
+        lineup_away[start:i] = current[False]
+        start = i
 
-            lineup_home_tmp = list(map(lambda x: x.replace(row[2], row[3]), lineup_home))
+        side = home_event[i]
+        lineup_tmp = [player_2[i] if player == player_1[i] else player for player in lineup[side]]
 
-            if len(lineup_home_tmp) == len(set(lineup_home_tmp)):
-                lineup_home = lineup_home_tmp
+        if len(lineup_tmp) == len(set(lineup_tmp)):
+            lineup[side] = lineup_tmp
+            current[side] = code(lineup_tmp)
 
-            
-        if row[0]==8 and row[5]==None and row[2]!=None and row[3]!=None:
+    lineup_home[start:] = current[True]
+    lineup_away[start:] = current[False]
 
-            lineup_away_tmp = list(map(lambda x: x.replace(row[2], row[3]), lineup_away))
-            
-            
-            if len(lineup_away_tmp) == len(set(lineup_away_tmp)):
-                lineup_away = lineup_away_tmp
+    return lineup_home, lineup_away
+
+def play_by_play_lineup(game_example):
+    lineup_codes = LineupCodes()
+    lineup_home, lineup_away = play_by_play_lineup_ids(game_example,lineup_codes)
+    table = lineup_codes.table()
 
-        current_lineup_home.append(lineup_home[:])
-        current_lineup_away.append(lineup_away[:])
-        
-    lineups = pd.DataFrame(data=[current_lineup_home,current_lineup_away])
-    lineups = lineups.T
-    lineups = lineups.rename(columns={0:'lineup_home',1:'lineup_away'})
-    return lineups
\ No newline at end of file
+    lineups = pd.DataFrame({'lineup_home': [list(lineup) for lineup in table[lineup_home]],
+                            'lineup_away': [list(lineup) for lineup in table[lineup_away]]})
+    return lineups
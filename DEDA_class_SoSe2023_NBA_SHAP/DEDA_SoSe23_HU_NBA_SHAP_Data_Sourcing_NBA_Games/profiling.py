@@ -0,0 +1,104 @@
+import cProfile
+import os
+import time
+
+import pandas as pd
+
+# Stage timers and counters (rows, lineups, predictions, ...) of a run:
+#   with profiler.stage('sql_fetch'):
+#       ...
+#       profiler.count('sql_fetch',rows=len(data.index))
+# NULL_PROFILER is the disabled default, its hooks do nothing
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class NullProfiler:
+    enabled = False
+
+    def stage(self,name):
+        return NULL_STAGE
+
+    def count(self,name,**counts):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+# counters reported with their throughput per second (the others only as totals, e.g. cache_hits)
+THROUGHPUT_COUNTERS = ('rows','games','lineups','predictions')
+
+
+class Stage:
+    def __init__(self,profiler,name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profile = self.profiler.profiles.get(self.name)
+        if profile is not None:
+            profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        seconds = time.perf_counter()-self.start
+        profile = self.profiler.profiles.get(self.name)
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(os.path.join(self.profiler.profile_dir,f'{self.name}.prof'))
+
+        stage = self.profiler.stages.setdefault(self.name,{'calls': 0,'seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        return False
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self,profile_dir=None):
+        # profile_dir: one cProfile dump per stage ({stage}.prof, e.g. for snakeviz or pstats)
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self.counts = {}
+        self.profiles = {}
+
+    def stage(self,name):
+        if self.profile_dir is not None and name not in self.profiles:
+            os.makedirs(self.profile_dir,exist_ok=True)
+            self.profiles[name] = cProfile.Profile()
+        return Stage(self,name)
+
+    def count(self,name,**counts):
+        stage_counts = self.counts.setdefault(name,{})
+        for counter, value in counts.items():
+            stage_counts[counter] = stage_counts.get(counter,0)+int(value)
+
+    def summary(self):
+        # one row per stage: calls, seconds, share of the total and its counters (with throughput per second)
+        rows = []
+        total = sum(stage['seconds'] for stage in self.stages.values())
+
+        for name, stage in self.stages.items():
+            row = {'stage': name,'calls': stage['calls'],'seconds': stage['seconds'],
+                   'share': stage['seconds']/total if total > 0 else None}
+            for counter, value in self.counts.get(name,{}).items():
+                row[counter] = value
+                if counter in THROUGHPUT_COUNTERS:
+                    row[f'{counter}/s'] = value/stage['seconds'] if stage['seconds'] > 0 else None
+            rows.append(row)
+
+        return pd.DataFrame(rows)
+
+    def report(self,title='stage timings'):
+        return f'{title}\n{self.summary().to_string(index=False,float_format=lambda value: f"{value:.4g}")}'
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from abs_values import Stat
+
+# Stints: runs of consecutive events of a game with the same 5 players of the team on court.
+# Every stint gets the team level stats of its events (same 18 stats as the player table, but counted once
+# per event for the lineup, not per player), so Dean's factors can be computed for lineups that actually played
+
+def event_stats(season,team):
+    # events x stats matrix of the increments of every event for team (season with parse_descriptions columns)
+    event_type = season['game_event_type'].to_numpy()
+    home = (season['home_team']==team).to_numpy()
+    has_player = season['player_1'].notna().to_numpy()
+    three = season['three_pointer'].to_numpy(dtype=bool)
+    miss = season['miss'].to_numpy(dtype=bool)
+
+    home_desc = season['home_desc'].notna().to_numpy()
+    away_desc = season['away_desc'].notna().to_numpy()
+    own_desc = np.where(home,home_desc,away_desc)
+    opp_desc = np.where(home,away_desc,home_desc)
+
+    # same side rules as player_data_calc: own event --> no description of the opponent, and vice versa
+    own = ~opp_desc & has_player
+    opp = ~own_desc & has_player
+
+    # rebounds: increase of the rebounder's Off/Def totals since their last rebound of the game
+    rebound = (event_type==4) & has_player & season['has_rebound_totals'].to_numpy(dtype=bool)
+    off_increase = np.zeros(len(season.index),dtype=np.int32)
+    def_increase = np.zeros(len(season.index),dtype=np.int32)
+
+    rebounds = season.loc[rebound,['game_id','player_1','off_rebounds','def_rebounds']]
+    previous = rebounds.groupby(['game_id','player_1'],sort=False)[['off_rebounds','def_rebounds']].shift(fill_value=0)
+    off_increase[rebound] = np.clip(rebounds['off_rebounds'].to_numpy()-previous['off_rebounds'].to_numpy(),0,None)
+    def_increase[rebound] = np.clip(rebounds['def_rebounds'].to_numpy()-previous['def_rebounds'].to_numpy(),0,None)
+
+    shot = {1: event_type==1, 2: event_type==2}
+    freethrow = event_type==3
+
+    stats = np.zeros((len(season.index),len(Stat)),dtype=np.int32)
+    stats[:,Stat.twopointers] = shot[1] & own & ~three
+    stats[:,Stat.threepointers] = shot[1] & own & three
+    stats[:,Stat.misses_two] = shot[2] & own & ~three
+    stats[:,Stat.misses_three] = shot[2] & own & three
+    stats[:,Stat.opp_twopointers] = shot[1] & opp & ~three
+    stats[:,Stat.opp_threepointers] = shot[1] & opp & three
+    stats[:,Stat.opp_misses_two] = shot[2] & opp & ~three
+    stats[:,Stat.opp_misses_three] = shot[2] & opp & three
+    stats[:,Stat.turnovers] = (event_type==5) & own
+    stats[:,Stat.forced_turnovers] = (event_type==5) & opp_desc & ~own_desc
+    stats[:,Stat.freethrows] = freethrow & own & ~miss
+    stats[:,Stat.misses_freethrow] = freethrow & own & miss
+    stats[:,Stat.offensive_rebounds] = np.where(rebound & own,off_increase,0)
+    stats[:,Stat.defensive_rebounds] = np.where(rebound & own,def_increase,0)
+    stats[:,Stat.opp_freethrows] = freethrow & opp & ~miss
+    stats[:,Stat.opp_misses_freethrow] = freethrow & opp & miss
+    stats[:,Stat.opp_offensive_rebounds] = np.where(rebound & opp,off_increase,0)
+    stats[:,Stat.opp_defensive_rebounds] = np.where(rebound & opp,def_increase,0)
+
+    return stats
+
+def stint_table(season,lineup_table,team):
+    # season: pbp rows of the team season ordered by game and event, with the lineup id columns of
+    # data_sourcing.track_lineups and the parse_descriptions columns
+    home = (season['home_team']==team).to_numpy()
+    lineup_id = np.where(home,season['home_lineup_id'].to_numpy(),season['away_lineup_id'].to_numpy())
+    game_id = season['game_id'].to_numpy()
+
+    # a stint starts with every new game and every change of the team's lineup
+    start = np.ones(len(game_id),dtype=bool)
+    start[1:] = (game_id[1:]!=game_id[:-1]) | (lineup_id[1:]!=lineup_id[:-1])
+    starts = np.flatnonzero(start)
+
+    # stats of all events of a stint in one reduction
+    stats = np.add.reduceat(event_stats(season,team),starts,axis=0) if len(starts) else np.zeros((0,len(Stat)),dtype=np.int32)
+
+    # players of each stint's lineup in name order, so the same five players always give the same lineup
+    # (None padded if fewer than 5 starters could be found for a game)
+    players = np.array([(sorted(lineup)+[None]*5)[:5] for lineup in lineup_table[lineup_id[starts]]],dtype=object).reshape(-1,5)
+
+    win = np.where(home,season['wl_home'].astype(object).to_numpy()=='W',season['wl_home'].astype(object).to_numpy()=='L')
+
+    stints = {'game_id': game_id[starts],
+              'stint': pd.Series(game_id[starts]).groupby(game_id[starts],sort=False).cumcount().to_numpy(),
+              'events': np.diff(np.append(starts,len(game_id)))}
+    for i in range(5):
+        stints[f'player{i+1}'] = pd.Categorical(players[:,i])
+    for stat in Stat:
+        stints[stat.name] = stats[:,stat]
+    stints['win'] = win[starts].astype(np.int8)
+
+    return pd.DataFrame(stints)
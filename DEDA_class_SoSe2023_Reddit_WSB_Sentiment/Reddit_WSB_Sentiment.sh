@@ -2,9 +2,9 @@
 # AND DOWNLOAD THE KAGGLE POSTS DATA IN README BEFORE RUNNING ANYTHING!
 cd src
 
-# If your internet connection is unstable, make sure to change the last line of the file below
-# to reflect the last posts you were able to scrape. The last posts id is the name in the logs when it fails or inside the
-# data/comments directory
+# Comments are committed in shards to data/comments with a cursor.json, if the script fails (e.g. an unstable internet
+# connection) just run it again and it resumes after the last committed post. --from_id overrides the cursor.
+# --workers and --requests_per_minute set the requests in flight and the API quota they share
 python 00-get_posts_comments.py
 
 python 01-join-all-comments.py
@@ -1,10 +1,13 @@
-import pandas as pd
 import logging
+import threading
 from config import parse_args
-import gc
+from comment_fetcher import ConcurrentFetcher, FetchError, TokenBucket
+from comment_store import CommentStore
+from post_index import PostIndex
 from typing import Tuple
 import praw
 import yaml
+from prawcore import Requestor
 from prawcore.exceptions import PrawcoreException
 from praw.models import MoreComments
 from yaml.loader import SafeLoader
@@ -15,23 +18,57 @@ with open('../config-personal.yml') as f:
 logging.basicConfig(level=logging.DEBUG, filename='logs/00-get_post_comments.log', filemode='w')
 
 
+class LimitedRequestor(Requestor):
+    # prawcore requestor taking a token of the shared limiter for every HTTP request, so the retries prawcore does on
+    # its own (5xx responses, connection errors) and the token requests count against the quota as well
+    def __init__(self, *args, limiter: TokenBucket = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        self.limiter.acquire()
+        return super().request(*args, **kwargs)
+
+
 class RedditCommentLoader(object):
-    def __init__(self, from_id: str = None) -> None:  #
-        self.reddit = praw.Reddit(
-            client_id=config['reddit']['client_id'],
-            client_secret=config['reddit']['secret'],
-            user_agent=f"testscript by u/{config['reddit']['user_name']}",
-        )
-        self.post_ids = pd.read_csv('../data/wallstreetbets.zip').loc[:, 'id'].tolist()
-        self.comment_dict = {'id_col': [], 'comments': [], 'score': []}
+    def __init__(self, from_id: str = None, workers: int = 8, requests_per_minute: float = 100, burst: int = 10,
+                 retries: int = 5, reddit_url: str = None, oauth_url: str = None, batch_size: int = 50000) -> None:
+        # praw instances are not thread safe, every fetcher thread gets its own (see get_reddit)
+        self.local = threading.local()
+        self.urls = {key: url for key, url in [('reddit_url', reddit_url), ('oauth_url', oauth_url)] if url}
+
+        # persisted id index of the posts dump (built once from its id column), resuming needs no csv parse
+        self.post_index = PostIndex('../data/wallstreetbets.zip')
         self.post_c = 0
-        self.last_post_id = None
-        self.from_id = from_id
+
+        # comments are committed to ../data/comments/ in shards, without from_id a run resumes after the last
+        # committed post
+        self.store = CommentStore('../data/comments/', batch_size=batch_size)
+        self.from_id = from_id or self.store.cursor['last_post_id']
+
+        # the token bucket is shared by all threads, so together they stay within the API quota. It is taken by
+        # every HTTP request of praw (LimitedRequestor), not once per fetch attempt
+        self.limiter = TokenBucket(requests_per_minute / 60, burst)
+        self.fetcher = ConcurrentFetcher(self.draw_comments, workers=workers, limiter=self.limiter, retries=retries,
+                                         retry_on=(PrawcoreException,), acquire_per_attempt=False)
+
+    def get_reddit(self) -> praw.Reddit:
+        if not hasattr(self.local, 'reddit'):
+            self.local.reddit = praw.Reddit(
+                client_id=config['reddit']['client_id'],
+                client_secret=config['reddit']['secret'],
+                user_agent=f"testscript by u/{config['reddit']['user_name']}",
+                check_for_updates=False,
+                requestor_class=LimitedRequestor,
+                requestor_kwargs={'limiter': self.limiter},
+                **self.urls,
+            )
+        return self.local.reddit
 
     def draw_comments(self, post_id: str) -> Tuple:
         comment_ls = []
         score_ls = []
-        post = self.reddit.submission(post_id)
+        post = self.get_reddit().submission(post_id)
         for top_level_comment in post.comments:
             if isinstance(top_level_comment, MoreComments):
                 continue
@@ -41,53 +78,29 @@ class RedditCommentLoader(object):
         return comment_ls, score_ls
 
     def run(self) -> None:
-        if self.from_id:
-            ind = self.post_ids.index(self.from_id)
-            self.post_ids = self.post_ids[ind+1:]
+        post_ids = self.post_index.ids_after(self.from_id)
 
         logging.info('Comment process starting now')
         print('Comment process starting now')
 
-        for post_id in self.post_ids:
-            self.post_c += 1
-            for i in range(3):
-                try:
-                    comment_ls, score_ls = self.draw_comments(post_id)
-
-                    self.comment_dict['id_col'].extend([post_id]*len(comment_ls))
-                    self.comment_dict['comments'].extend(comment_ls)
-                    self.comment_dict['score'].extend(score_ls)
-
-                    break
-                except PrawcoreException:
-                    logging.exception(f'Got into a thing ...\n{PrawcoreException.__str__}')
-                    logging.info(f'Retrying ...')
-
-                    if i >= 2:
-                        logging.info(f'Last item was {post_id}. Only part of the comments are saved')
-                        self.last_post_id = post_id
-                        self.push_data(which='momentary')
-                        raise
-
-            gc.collect()
-
-            if self.post_c % 500 == 0:
-                print(f'{self.post_c} post with comments have been processed')
-
-        self.push_data(which='complete')
-
-    def push_data(self, which: str) -> None:
-        if which == 'momentary':
-            df = pd.DataFrame(self.comment_dict)
-            path = f'../data/comments/comments-until-{self.last_post_id}.zip'
-            df.to_csv(path, index=False, compression='zip')
-        else:
-            logging.info('All the comments went through')
-            df = pd.DataFrame(self.comment_dict)
-            df.to_csv('../data/comments/comment-full.zip', index=False, compression='zip')
-            logging.info('All comments were saved successfully')
-
-
-# args = parse_args()
-redd = RedditCommentLoader(from_id='j1fmmo')  # Change to the preferred post id. Default is the first post on the Kaggle database
+        try:
+            for post_id, (comment_ls, score_ls) in self.fetcher.run(map(str, post_ids)):
+                self.post_c += 1
+                self.store.add(post_id, comment_ls, score_ls)
+
+                if self.post_c % 500 == 0:
+                    print(f'{self.post_c} post with comments have been processed')
+        except FetchError as e:
+            logging.info(f'Last item was {e.post_id}. The comments until the post before are saved, rerun to resume')
+            raise
+        finally:
+            # everything returned by the fetcher is complete, commit it also on errors and interrupts
+            self.store.flush()
+
+        logging.info('All the comments went through')
+
+args = parse_args()
+redd = RedditCommentLoader(from_id=args.from_id, workers=args.workers, requests_per_minute=args.requests_per_minute,
+                           burst=args.burst, retries=args.retries, reddit_url=args.reddit_url, oauth_url=args.oauth_url,
+                           batch_size=args.batch_size)
 redd.run()
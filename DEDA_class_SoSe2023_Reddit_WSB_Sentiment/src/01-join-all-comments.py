@@ -1,21 +1,126 @@
-import pandas as pd
 import os
+import tempfile
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # folder path
 dir_path = '../data/comments/'
+out_path = '../data/all_comments.parquet'
+
+# rows read from a shard at a time, the only comments held in memory
+chunksize = 100000
+
+# comments are duplicates if these columns are equal (overlapping shards of interrupted runs)
+dedup_cols = ['id_col', 'comments']
+
+# most (hash, row) pairs of a partition held in memory, 16 bytes each, partitions with more are split again
+max_partition_rows = 1000000
+
+# partitions per split, by 8 bits of the hash (the top 8 bits first)
+fanout = 256
+
+schema = pa.schema([('id_col', pa.string()), ('comments', pa.string()), ('score', pa.int64())])
+spill_dtype = np.dtype([('hash', '<u8'), ('row', '<u8')])
+
+# Comments are de-duplicated in three streaming passes over the shards, memory is bounded by chunksize rows and
+# max_partition_rows pairs whatever the input size (the pairs and a keep flag per row are spilled to a temporary
+# directory next to out_path):
+#   1. the 64 bit hash of the dedup_cols of every row is appended with its row number to the file of its top 8 bits
+#   2. every partition file marks the first row of each of its hashes in the keep flags
+#   3. the rows marked are written, in the order of the shards
+# As before, two different comments are only taken for duplicates if their 64 bit hashes collide (probability
+# about n**2 / 2**65 for n distinct comments, below 1e-7 for 1e6 comments)
+
+
+def shard_paths() -> List[str]:
+    # zip files of the directory in name order (comments-shard-* of the comment store in commit order)
+    return [os.path.join(dir_path, path) for path in sorted(os.listdir(dir_path))
+            if os.path.isfile(os.path.join(dir_path, path)) and path[-3:] == 'zip']
+
+
+def read_shard(path: str) -> Iterator[pd.DataFrame]:
+    for df in pd.read_csv(path, encoding='latin', dtype={'id_col': str, 'comments': str}, chunksize=chunksize):
+        df['score'] = pd.to_numeric(df['score'], errors='coerce').astype('Int64')
+        yield df[schema.names]
+
+
+def spill(pairs: np.ndarray, files: List, shift: int) -> None:
+    # pairs appended to the file of their hash bits shift to shift + 8, in row order within every file
+    parts = ((pairs['hash'] >> np.uint64(shift)) & np.uint64(fanout - 1)).astype(np.intp)
+    order = np.argsort(parts, kind='stable')
+    bounds = np.searchsorted(parts[order], np.arange(fanout + 1))
+
+    for part in np.flatnonzero(np.diff(bounds)):
+        files[part].write(pairs[order[bounds[part]:bounds[part + 1]]].tobytes())
+
+
+def partition_files(path: str) -> List:
+    return [open(f'{path}-{part:03d}', 'wb') for part in range(fanout)]
+
+
+def mark_first_rows(path: str, shift: int, keep: np.ndarray) -> None:
+    # first row of every hash of a partition file (all its hashes have the same bits from shift up) --> keep
+    if os.path.getsize(path) == 0:
+        return
+    pairs = np.memmap(path, dtype=spill_dtype, mode='r')
+
+    if shift == 0:
+        # all 64 bits are equal, one comment
+        keep[pairs['row'][0]] = True
+    elif len(pairs) > max_partition_rows:
+        files = partition_files(path)
+        for start in range(0, len(pairs), max_partition_rows):
+            spill(np.array(pairs[start:start + max_partition_rows]), files, shift - 8)
+        for f in files:
+            f.close()
+
+        for f in files:
+            mark_first_rows(f.name, shift - 8, keep)
+    else:
+        pairs = np.array(pairs)
+        _, first = np.unique(pairs['hash'], return_index=True)
+        keep[pairs['row'][first]] = True
+
+    del pairs
+    os.remove(path)
+
+
+rows = 0
+written = 0
+
+with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as spill_dir:
+    # 1. (hash, row number) of every row into the partition files of the top 8 bits of the hash
+    files = partition_files(os.path.join(spill_dir, 'hashes'))
+    for path in shard_paths():
+        for df in read_shard(path):
+            pairs = np.empty(len(df.index), dtype=spill_dtype)
+            pairs['hash'] = pd.util.hash_pandas_object(df[dedup_cols], index=False).to_numpy()
+            pairs['row'] = np.arange(rows, rows + len(df.index))
+            spill(pairs, files, 64 - 8)
+            rows += len(df.index)
+    for f in files:
+        f.close()
+
+    # 2. keep flag of the first row of every distinct comment, a memory mapped file
+    keep = np.memmap(os.path.join(spill_dir, 'keep'), dtype=bool, mode='w+', shape=(max(rows, 1),))
+    for f in files:
+        mark_first_rows(f.name, 64 - 8, keep)
+
+    # 3. every chunk of the rows kept is appended as a row group, the output is never held in memory as a whole
+    row = 0
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for path in shard_paths():
+            for chunk in read_shard(path):
+                df = chunk[keep[row:row + len(chunk.index)]]
+                row += len(chunk.index)
+                if not df.empty:
+                    writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                    written += len(df.index)
+            print(f'{path} reading finished')
+    del keep
 
-# list to store files
-res = []
-df_l = []
-# Iterate directory
-for path in os.listdir(dir_path):
-    # check if current path is a zip file
-    if os.path.isfile(os.path.join(dir_path, path)) and path[-3:] == 'zip':
-        df = pd.read_csv(dir_path + path, encoding='latin')
-        df_l.append(df)
-        print(f'{path} reading finished')
-
-df_res = pd.concat(df_l)
-df_res.to_csv('../data/all_comments.zip', index=False, compression='zip')
-
-print('All comments were saved into all_comments.zip')
+print(f'{written} distinct comments of {rows} were saved into {out_path}')
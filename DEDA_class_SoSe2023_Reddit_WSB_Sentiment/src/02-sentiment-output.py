@@ -1,10 +1,12 @@
 import pandas as pd
 from transformers import AutoModelForSequenceClassification, pipeline
 from typing import AnyStr
+from sentiment_engine import BucketedSentiment
 
 df_posts = pd.read_csv('../data/wallstreetbets.zip')
-df_comments = pd.read_csv('../data/all_comments.zip')
-sentiment_model = pipeline(model='mwkby/distilbert-base-uncased-sentiment-reddit-crypto')
+df_comments = pd.read_parquet('../data/all_comments.parquet')
+# the pipeline's model and tokenizer, run in length sorted batches (see sentiment_engine.py)
+sentiment_model = BucketedSentiment(pipeline(model='mwkby/distilbert-base-uncased-sentiment-reddit-crypto'), batch_size=64)
 
 
 class SentimentOutput(object):
@@ -38,6 +40,11 @@ class SentimentOutput(object):
         self.df['sent_label'] = [dct['label'] for dct in sent_ls]
         self.df['sent_score'] = [dct['score'] for dct in sent_ls]
 
+        stats = getattr(self.model, 'stats', None)
+        if stats and stats['texts']:
+            print(f"{stats['texts']} {self.kind} classified in {stats['seconds']:.1f}s, "
+                  f"{stats['tokens_per_second']:.0f} tokens/s ({stats['padding_free']:.0%} of the batched tokens are not padding)")
+
         if self.kind == 'posts':
             self.df = self.df.drop(self.n_col, axis=1)
 
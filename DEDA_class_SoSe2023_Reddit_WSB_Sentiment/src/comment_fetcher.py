@@ -0,0 +1,120 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+class FetchError(Exception):
+    def __init__(self, post_id: str) -> None:
+        super().__init__(f'Could not fetch the comments of post {post_id}')
+        self.post_id = post_id
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    # seconds of the Retry-After header of a 429 (prawcore's TooManyRequests.retry_after), None without one
+    # (or in the HTTP date form)
+    try:
+        return float(getattr(e, 'retry_after', None))
+    except (TypeError, ValueError):
+        return None
+
+
+# Thread safe token bucket: rate tokens per second, at most capacity saved up for bursts
+class TokenBucket(object):
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        # no tokens for seconds (e.g. the Retry-After of a 429), tokens saved up before are dropped
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.updated = self.paused_until
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+# Runs fetch(post_id) for many posts on a thread pool, at most workers requests in flight.
+# Every attempt takes a token of the limiter (the API quota is shared by all threads), unless acquire_per_attempt is
+# False because fetch's own requests take them (see LimitedRequestor of 00-get_posts_comments.py). Attempts failing
+# with one of the retry_on exceptions are retried after an exponential backoff with jitter, or after the Retry-After
+# of a 429, which pauses the limiter for all threads. Results come back in the order of the post ids, so everything
+# before a post that failed for good has been returned
+class ConcurrentFetcher(object):
+    def __init__(self, fetch: Callable, workers: int = 8, limiter: TokenBucket = None, retries: int = 5,
+                 backoff: float = 1.0, max_backoff: float = 60.0, retry_on: Tuple = (Exception,),
+                 acquire_per_attempt: bool = True) -> None:
+        self.fetch = fetch
+        self.workers = workers
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_on = retry_on
+        self.acquire_per_attempt = acquire_per_attempt
+
+    def fetch_with_retries(self, post_id: str):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None and self.acquire_per_attempt:
+                self.limiter.acquire()
+
+            try:
+                return self.fetch(post_id)
+            except self.retry_on as e:
+                if attempt == self.retries:
+                    logging.exception(f'Giving up on post {post_id} after {attempt + 1} attempts')
+                    raise FetchError(post_id) from e
+
+                wait = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                server_wait = retry_after(e)
+                if server_wait is not None:
+                    if self.limiter is not None:
+                        self.limiter.pause(server_wait)
+                    wait = max(wait, server_wait)
+                logging.warning(f'Post {post_id} failed ({e!r}), retrying in {wait:.1f}s')
+                time.sleep(wait)
+
+    def run(self, post_ids: Iterable[str]) -> Iterator[Tuple[str, object]]:
+        # (post_id, fetch result) pairs, a window of 2 * workers posts is submitted ahead of the one returned next
+        post_ids = iter(post_ids)
+        window = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for post_id in post_ids:
+                    window.append((post_id, pool.submit(self.fetch_with_retries, post_id)))
+                    if len(window) >= 2 * self.workers:
+                        post_id, future = window.popleft()
+                        yield post_id, future.result()
+
+                while window:
+                    post_id, future = window.popleft()
+                    yield post_id, future.result()
+            finally:
+                # failed (or abandoned) runs do not wait for the posts queued behind
+                for _, future in window:
+                    future.cancel()
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import re
+from typing import List
+
+import pandas as pd
+
+# Append-only store of the scraped comments: every batch_size comments or batch_posts posts (only complete posts)
+# are written as a new zip shard comments-shard-{n}.zip (same columns as before, 01-join-all-comments.py joins all zips of the
+# directory), then cursor.json is replaced with the last post of the shard and the number of the next shard.
+# Both writes go to a temporary file first and are renamed, so a crash leaves either the old or the new state;
+# a shard written after the last cursor update is removed on opening and its posts are scraped again
+SHARD_PATTERN = re.compile(r'comments-shard-(\d+)\.zip$')
+
+
+def replace_file(path: str, write) -> None:
+    tmp_path = f'{path}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CommentStore(object):
+    def __init__(self, directory: str = '../data/comments/', batch_size: int = 50000, batch_posts: int = 1000) -> None:
+        self.directory = directory
+        self.batch_size = batch_size
+        self.batch_posts = batch_posts
+        self.cursor_path = os.path.join(directory, 'cursor.json')
+
+        self.comment_dict = {'id_col': [], 'comments': [], 'score': []}
+        self.last_post_id = None
+        self.posts = 0
+        self.cursor = self.read_cursor()
+
+        for path in os.listdir(directory):
+            match = SHARD_PATTERN.match(path)
+            if match and int(match.group(1)) >= self.cursor['next_shard']:
+                logging.info(f'Removing {path}, it was written after the last cursor update')
+                os.remove(os.path.join(directory, path))
+
+    def read_cursor(self) -> dict:
+        if not os.path.exists(self.cursor_path):
+            return {'last_post_id': None, 'next_shard': 0, 'posts': 0, 'comments': 0}
+
+        with open(self.cursor_path) as f:
+            return json.load(f)
+
+    def add(self, post_id: str, comment_ls: List, score_ls: List) -> None:
+        # all comments of a post at once, shards only hold complete posts
+        self.comment_dict['id_col'].extend([post_id]*len(comment_ls))
+        self.comment_dict['comments'].extend(comment_ls)
+        self.comment_dict['score'].extend(score_ls)
+        self.last_post_id = post_id
+        self.posts += 1
+
+        if len(self.comment_dict['id_col']) >= self.batch_size or self.posts >= self.batch_posts:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.posts == 0:
+            return
+
+        shard = self.cursor['next_shard']
+        if self.comment_dict['id_col']:
+            name = f'comments-shard-{shard:06d}'
+            df = pd.DataFrame(self.comment_dict)
+            replace_file(os.path.join(self.directory, f'{name}.zip'),
+                         lambda tmp_path: df.to_csv(tmp_path, index=False, compression={'method': 'zip', 'archive_name': f'{name}.csv'}))
+            shard += 1
+
+        cursor = {'last_post_id': self.last_post_id, 'next_shard': shard, 'posts': self.cursor['posts'] + self.posts,
+                  'comments': self.cursor['comments'] + len(self.comment_dict['id_col'])}
+
+        def write_cursor(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(cursor, f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        replace_file(self.cursor_path, write_cursor)
+        self.cursor = cursor
+        logging.info(f'Comments committed until post {self.last_post_id} ({cursor["posts"]} posts, {cursor["comments"]} comments)')
+
+        self.comment_dict = {'id_col': [], 'comments': [], 'score': []}
+        self.posts = 0
@@ -5,7 +5,14 @@ import random
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--from_id', type=str)
+    parser.add_argument('--from_id', type=str, default=None, help='last post already scraped (default: from the cursor)')
+    parser.add_argument('--workers', type=int, default=8, help='submission requests in flight')
+    parser.add_argument('--requests_per_minute', type=float, default=100, help='Reddit API quota of the client id')
+    parser.add_argument('--burst', type=int, default=10, help='requests that may be sent at once after idle time')
+    parser.add_argument('--retries', type=int, default=5, help='retries per post before giving up')
+    parser.add_argument('--reddit_url', type=str, default=None, help='e.g. http://localhost:8080 for reddit_stub.py')
+    parser.add_argument('--oauth_url', type=str, default=None)
+    parser.add_argument('--batch_size', type=int, default=50000, help='comments per committed shard')
 
     args = parser.parse_args()
 
@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# Post ids of the Kaggle posts dump, persisted next to it so a run does not parse the whole csv to find its position:
+#   {dataset}-ids.npy         ids in row order
+#   {dataset}-ids-order.npy   rows sorted by id, for binary search lookups of the row of an id
+#   {dataset}-ids.json        size and modification time of the dump the index was built from
+# Both arrays are memory mapped, the index is rebuilt (reading only the id column) when the dump changes
+
+
+class PostIndex(object):
+    def __init__(self, dataset: str = '../data/wallstreetbets.zip', chunksize: int = 100000) -> None:
+        self.dataset = dataset
+        self.chunksize = chunksize
+
+        base = os.path.splitext(dataset)[0]
+        self.ids_path = f'{base}-ids.npy'
+        self.order_path = f'{base}-ids-order.npy'
+        self.meta_path = f'{base}-ids.json'
+
+        if not self.is_current():
+            self.build()
+
+        self.ids = np.load(self.ids_path, mmap_mode='r')
+        self.order = np.load(self.order_path, mmap_mode='r')
+
+    def dataset_meta(self) -> dict:
+        stat = os.stat(self.dataset)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def is_current(self) -> bool:
+        if not all(os.path.exists(path) for path in [self.ids_path, self.order_path, self.meta_path]):
+            return False
+
+        with open(self.meta_path) as f:
+            return json.load(f) == self.dataset_meta()
+
+    def build(self) -> None:
+        logging.info(f'Building the post id index of {self.dataset}')
+        chunks = pd.read_csv(self.dataset, usecols=['id'], dtype={'id': str}, chunksize=self.chunksize)
+        ids = np.concatenate([chunk['id'].to_numpy(dtype=str) for chunk in chunks])
+
+        np.save(self.ids_path, ids)
+        np.save(self.order_path, np.argsort(ids, kind='stable'))
+        # written last, an interrupted build is redone on the next run
+        with open(self.meta_path, 'w') as f:
+            json.dump(self.dataset_meta(), f)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, post_id: str) -> int:
+        # first row of post_id, ValueError if it is not in the dump
+        pos = np.searchsorted(self.ids, post_id, sorter=self.order)
+        if pos == len(self.ids) or self.ids[self.order[pos]] != post_id:
+            raise ValueError(f'{post_id} is not in {self.dataset}')
+
+        return int(self.order[pos])
+
+    def ids_after(self, post_id: str = None) -> np.ndarray:
+        # ids of the rows after post_id (all without post_id), a view of the memory mapped ids
+        if post_id is None:
+            return self.ids
+
+        return self.ids[self.row(post_id) + 1:]
@@ -0,0 +1,132 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+# Local stand-in for the Reddit API endpoints 00-get_posts_comments.py uses, to try the fetcher without the real API:
+#   python reddit_stub.py --port 8080 --latency 0.3 --error_rate 0.05
+#   python 00-get_posts_comments.py --reddit_url http://localhost:8080 --oauth_url http://localhost:8080
+# Every post gets a fixed number of made up top level comments (derived from its id), requests above the quota
+# per minute get a 429 (with a Retry-After header) and a share error_rate of the others a 503
+
+
+class StubState(object):
+    def __init__(self, latency: float, error_rate: float, quota: int, max_comments: int) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota = quota
+        self.max_comments = max_comments
+
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.counts = {'requests': 0, 'throttled': 0, 'errors': 0}
+
+    def admit(self) -> Tuple[int, float]:
+        # status code of the next submission request: 429 above the quota of the last 60 seconds (with the seconds
+        # until the oldest request of the window expires, sent as Retry-After), 503 at random
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and self.recent[0] <= now - 60:
+                self.recent.popleft()
+
+            self.counts['requests'] += 1
+            if self.quota and len(self.recent) >= self.quota:
+                self.counts['throttled'] += 1
+                return 429, self.recent[0] + 60 - now
+            self.recent.append(now)
+
+            if random.random() < self.error_rate:
+                self.counts['errors'] += 1
+                return 503, 0.0
+
+        return 200, 0.0
+
+
+def submission_listing(post_id: str, max_comments: int) -> list:
+    # [submission listing, comment listing] of /comments/{id}, the comments only depend on the post id
+    seed = zlib.crc32(post_id.encode())
+    comments = [{'kind': 't1', 'data': {'id': f'{post_id}c{i}', 'name': f't1_{post_id}c{i}', 'parent_id': f't3_{post_id}',
+                                        'link_id': f't3_{post_id}', 'body': f'comment {i} on {post_id}',
+                                        'score': (seed + i) % 1000 - 100, 'replies': ''}}
+                for i in range(seed % (max_comments + 1))]
+
+    return [{'kind': 'Listing', 'data': {'children': [{'kind': 't3', 'data': {'id': post_id, 'name': f't3_{post_id}',
+                                                                              'title': f'post {post_id}'}}],
+                                         'after': None, 'before': None}},
+            {'kind': 'Listing', 'data': {'children': comments, 'after': None, 'before': None}}]
+
+
+def make_handler(state: StubState):
+    class RedditStubHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, data, retry_after: float = None) -> None:
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header('Retry-After', str(math.ceil(retry_after)))
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path.startswith('/api/v1/access_token'):
+                self.send_json(200, {'access_token': 'stub-token', 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'})
+            else:
+                self.send_json(404, {'message': 'Not Found', 'error': 404})
+
+        def do_GET(self) -> None:
+            match = re.match(r'/comments/(\w+)', self.path)
+            if match is None:
+                self.send_json(404, {'message': 'Not Found', 'error': 404})
+                return
+
+            time.sleep(state.latency)
+            status, retry_after = state.admit()
+            if status != 200:
+                self.send_json(status, {'message': 'Stub error', 'error': status}, retry_after if status == 429 else None)
+                return
+
+            self.send_json(200, submission_listing(match.group(1), state.max_comments))
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return RedditStubHandler
+
+
+def serve(port: int = 8080, latency: float = 0.3, error_rate: float = 0.0, quota: int = 0,
+          max_comments: int = 30) -> ThreadingHTTPServer:
+    # started in a background thread, stop with server.shutdown(); server.state holds the request counts
+    state = StubState(latency, error_rate, quota, max_comments)
+    server = ThreadingHTTPServer(('localhost', port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds per submission request')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='share of submission requests answered with a 503')
+    parser.add_argument('--quota', type=int, default=0, help='requests per minute before 429s (0: no limit)')
+    parser.add_argument('--max_comments', type=int, default=30)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.error_rate, args.quota, args.max_comments)
+    print(f'Reddit stub listening on http://localhost:{args.port}')
+    try:
+        while True:
+            time.sleep(10)
+            print(server.state.counts)
+    except KeyboardInterrupt:
+        server.shutdown()
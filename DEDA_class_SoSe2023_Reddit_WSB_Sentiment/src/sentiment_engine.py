@@ -0,0 +1,69 @@
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+
+class BucketedSentiment(object):
+    # Text classification with the model and tokenizer of a HF pipeline, called like the pipeline
+    # (engine(texts, truncation=True) --> [{'label': ..., 'score': ...}, ...]), but:
+    #   - texts are tokenized in windows of sort_window texts and sorted by token length, so every batch of
+    #     batch_size texts is only padded to the longest of similar lengths
+    #   - batches run under torch.inference_mode
+    #   - results come back in the original order, the throughput of the last call is in self.stats
+    def __init__(self, pipe, batch_size: int = 64, sort_window: int = 10000, max_length: int = None) -> None:
+        self.model = pipe.model
+        self.tokenizer = pipe.tokenizer
+        self.device = pipe.device
+        self.batch_size = batch_size
+        self.sort_window = sort_window
+
+        # longest input the model takes (tokenizers of some models report a huge model_max_length)
+        max_positions = getattr(self.model.config, 'max_position_embeddings', None) or self.tokenizer.model_max_length
+        self.max_length = max_length or min(self.tokenizer.model_max_length, max_positions)
+
+        self.model.eval()
+        self.labels = self.model.config.id2label
+        # softmax over the labels like the text-classification pipeline, sigmoid for single or multi label models
+        self.sigmoid = self.model.config.num_labels == 1 or self.model.config.problem_type == 'multi_label_classification'
+        self.stats = {}
+
+    def classify_batch(self, encodings: Dict) -> np.ndarray:
+        batch = self.tokenizer.pad(encodings, return_tensors='pt')
+        batch = {key: value.to(self.device) for key, value in batch.items()}
+
+        logits = self.model(**batch).logits.float()
+        proba = torch.sigmoid(logits) if self.sigmoid else torch.softmax(logits, dim=-1)
+
+        return proba.cpu().numpy()
+
+    def __call__(self, texts: List[str], truncation: bool = True) -> List[Dict]:
+        start = time.perf_counter()
+        labels = np.empty(len(texts), dtype=object)
+        scores = np.empty(len(texts))
+        tokens = padded = 0
+
+        with torch.inference_mode():
+            for window_start in range(0, len(texts), self.sort_window):
+                window = texts[window_start:window_start + self.sort_window]
+                encodings = self.tokenizer(window, truncation=truncation, max_length=self.max_length)
+                lengths = np.array([len(ids) for ids in encodings['input_ids']])
+
+                for batch in np.array_split(np.argsort(lengths, kind='stable'), -(-len(window) // self.batch_size)):
+                    proba = self.classify_batch({key: [values[i] for i in batch] for key, values in encodings.items()})
+
+                    best = proba.argmax(axis=1)
+                    labels[window_start + batch] = [self.labels[label] for label in best]
+                    scores[window_start + batch] = proba[np.arange(len(batch)), best]
+
+                    tokens += lengths[batch].sum()
+                    padded += lengths[batch].max() * len(batch)
+
+        seconds = time.perf_counter() - start
+        # rates are 0.0 for empty inputs
+        self.stats = {'texts': len(texts), 'tokens': int(tokens), 'padded_tokens': int(padded), 'seconds': seconds,
+                      'tokens_per_second': tokens / seconds if seconds > 0 else 0.0,
+                      'padding_free': tokens / padded if padded > 0 else 0.0}
+
+        return [{'label': label, 'score': float(score)} for label, score in zip(labels, scores)]